@@ -4,20 +4,35 @@
 from __future__ import print_function
 
 import argparse
+import csv
 import inspect
+import json
 import os.path
 import re
+import shlex
 import shutil
+import subprocess
 import sys
 import tempfile
-import webbrowser
+import threading
 import urllib
+from StringIO import StringIO
 
 # installed:
+# (the libraries behind these are imported lazily, as are sh and webbrowser
+# below, to keep startup -- and so shell completion -- fast)
 from atlassian_jira import Jira
+from bulk import BulkExecutor
+from cache import bypassed
+from cache import make_cache
 from crucible import Crucible
-from sh import svn
+from resilience import stats as latency_stats
 from subversion import Subversion
+from rair import __version__
+
+
+# a Jira issue key, e.g. MMSANDBOX-1234:
+TICKET_PATTERN = r'[A-Z][A-Z0-9_]+-\d+'
 
 
 class MergeException(Exception):
@@ -28,6 +43,10 @@ class TicketSpecificationException(Exception):
     pass
 
 
+class InvalidAliasException(Exception):
+    pass
+
+
 class Commands(object):
     """
     This class encapsulates all the of the subcommands available for this
@@ -47,18 +66,47 @@ class Commands(object):
 
     def __init__(self, config):
         self.config = config
-        if 'jira' in config:
-            self.jira = Jira(config['jira'])
-        else:
-            self.jira = None
-        if 'svn' in config:
-            self.svn = Subversion(config['svn'])
-        else:
-            self.svn = None
-        if 'crucible' in config:
-            self.crucible = Crucible(config['crucible'])
-        else:
-            self.crucible = None
+        # the service clients are only created when a command first uses
+        # them, so commands that don't need Jira never log in to it:
+        self._clients = dict()
+        # ('air batch -j' runs commands in several threads):
+        self._clients_lock = threading.RLock()
+
+    def _client(self, name, factory):
+        with self._clients_lock:
+            if name not in self._clients:
+                if name in self.config:
+                    self._clients[name] = factory(self.config[name])
+                else:
+                    self._clients[name] = None
+            return self._clients[name]
+
+    @property
+    def jira(self):
+        return self._client('jira', Jira)
+
+    @property
+    def svn(self):
+        return self._client('svn', lambda config: Subversion(
+            config, cache_config=self.config.get('jira', {})))
+
+    @property
+    def crucible(self):
+        return self._client('crucible', Crucible)
+
+    def _caches(self, existing=False):
+        """
+        The on-disk caches that '--no-cache' bypasses (with 'existing',
+        only those of the clients created so far).
+        """
+        clients = self._clients if existing else {'jira': self.jira,
+                                                  'svn': self.svn}
+        caches = []
+        if clients.get('jira'):
+            caches.append(clients['jira'].issue_cache)
+        if clients.get('svn'):
+            caches.append(clients['svn'].branch_cache)
+        return caches
 
     def init(self, arger, args, out=sys.stdout):
         """
@@ -77,6 +125,17 @@ class Commands(object):
     server = https://jira.r.mutualmobile.com
 # new issues will be created in this project:
     project = MMSANDBOX
+# issues are cached on disk ('cache = off' disables it, as does passing
+# --no-cache to any command):
+#   cache_dir = ~/.air/cache
+#   issue_cache_ttl = 3600
+#   issue_cache_size = 1000
+#   filter_cache_ttl = 86400
+#   user_cache_ttl = 86400
+#   branch_cache_ttl = 300
+# 'air ls' and 'air list_reviews' can fetch the first few tickets listed
+# in the background, ready for the next command (0 is off):
+#   prefetch = 3
 
     [[list]]
 #       filter = 'assigned to me'
@@ -89,7 +148,31 @@ class Commands(object):
     password = changeme2
     key = CR-MMSANDBOX
     server = https://fisheye.r.mutualmobile.com
-
+# reviewers left on new reviews even though they weren't asked for (e.g.
+# deleted users a project adds by default, which can't be removed):
+#   ignore_reviewers = first.last,
+# connections to the server are kept open and reused; timeouts are seconds:
+#   pool_size = 10
+#   connect_timeout = 5
+#   read_timeout = 60
+# GETs that fail or time out are retried (after a random backoff of up to
+# 0.2, 0.4, 0.8... seconds); with hedge_after, a GET that hasn't been
+# answered after that many seconds is sent again and the first answer used.
+# These (and the timeouts) work the same way under [jira]:
+#   retries = 3
+#   backoff = 0.2
+#   hedge_after = 2
+# gzip patches sent for review (if the server takes compressed requests),
+# and upload patches bigger than this many bytes as a file:
+#   gzip_uploads = on
+#   patch_upload_limit = 20971520
+
+# shell completion data is refreshed in the background when older than:
+#[completion]
+#   ttl = 600
+# 'air --daemon' exits after this many seconds without a command:
+#[daemon]
+#   idle_timeout = 1800
 [aliases]
     ls=list_tickets
     start=start_work
@@ -115,32 +198,32 @@ class Commands(object):
         issue = self.jira.get_issue(opts.ticket)
         branch = self.svn.get_unique_branch(issue.key)
         # find available transitions for issue:
-        transitions = self.jira.server.transitions(issue)
         #TODO: move this functionality into the module?:
-        if 'In Review' in [x['name'] for x in transitions]:
+        if self.jira.find_transition(issue, 'In Review') is not None:
             # mark Jira issue as 'in review'
             self.jira.transition_issue(opts.ticket, status='In Review')
         # create review
-        self.review = self.crucible.create_review(opts.person,
-                                                  jira_ticket=issue.key)
+        review = self.crucible.create_review(opts.person,
+                                             jira_ticket=issue.key)
         # create diff
         #TODO: so this in SVN module:
         diff = self.svn.diff(branch)
         # add diff to review
-        self.review.add_patch(diff)
+        review.add_patch(diff)
         # "start" the review:
-        self.review.start()
+        review.start()
         # open review in browser
         if opts.open:
-            self.url = self.review.uri_frontend
+            import webbrowser
+            url = review.uri_frontend
             out.write('Opening review {0} in browser...'.format(
-                self.review.uri_frontend))
-            webbrowser.open_new_tab(self.url)
+                review.uri_frontend))
+            webbrowser.open_new_tab(url)
         # add Crucible URL to Jira ticket
         # as long as the Jira ticket is associated with Crucible then there's a
         # link under 'Reviews', so this isn't necessary:
-        #self.jira.add_comment(opts.ticket, 'Crucible: {0}'.format(self.url))
-        out.write('Created review {0} for ticket {1}..\n'.format(self.review,
+        #self.jira.add_comment(opts.ticket, 'Crucible: {0}'.format(url))
+        out.write('Created review {0} for ticket {1}..\n'.format(review,
                                                                  issue.key))
 
     def reject_ticket(self, arger, args, out=sys.stdout):
@@ -149,9 +232,8 @@ class Commands(object):
         opts = arger.parse_args(args)
         comment = 'Sending issue back for rework. Please see comments \
             in review.'
-        issue = self.jira.get_issue(opts.ticket)
-        self.jira.add_comment(issue.key, comment)
-        self.jira.transition_issue(issue.key, status='Reopen Issue')
+        self.jira.transition_issue(opts.ticket, status='Reopen Issue',
+                                   comment=comment)
 
     def start_work(self, arger, args, out=sys.stdout):
 
@@ -159,15 +241,15 @@ class Commands(object):
         start work on ticket (start progress and create branch)
         """
 
-        self.make_branch(arger, args)
+        self.make_branch(arger, args, out=out)
         opts = arger.parse_args(args)
         issue = self.jira.get_issue(opts.ticket)
-        out.write('Marking issue {0} as "In Progress"\n'.format(issue.key))
-        self.jira.transition_issue(opts.ticket, status='In Progress')
         branch = self.svn.get_unique_branch(opts.ticket)
         comment = 'SVN URL: ' + self.config['svn']['branch_url'] + '/' + branch
-        out.write('Adding SVN URL for branch to Jira issue\n')
-        self.jira.add_comment(issue.key, comment)
+        out.write('Marking issue {0} as "In Progress" and adding SVN URL for '
+                  'branch\n'.format(issue.key))
+        self.jira.transition_issue(opts.ticket, status='In Progress',
+                                   comment=comment)
 
     def add_watcher(self, arger, args, out=sys.stdout):
 
@@ -252,6 +334,7 @@ class Commands(object):
             if not opts.ticket:
                 raise TicketSpecificationException("ticket number required")
 
+        from sh import svn
         branch = self.svn.get_unique_branch(opts.ticket)
 
         src = '{0}/{1}'.format(self.config['svn']['branch_url'], branch)
@@ -294,6 +377,25 @@ class Commands(object):
 
         out.write(process.stdout)
 
+    def release_notes(self, arger, args, out=sys.stdout):
+        """
+        list the tickets mentioned in the SVN log between two revisions
+        """
+
+        arger.add_argument('--from', dest='start', required=True)
+        arger.add_argument('--to', dest='end', default='HEAD')
+        opts = arger.parse_args(args)
+
+        tickets = _find_tickets(self.svn.log(opts.start, opts.end))
+        issues = dict([(x.key, x) for x in self.jira.get_issues(tickets)])
+        for ticket in tickets:
+            issue = issues.get(ticket)
+            if issue is None:
+                # not an issue after all (e.g. 'UTF-8'), or deleted:
+                continue
+            out.write('{0}:\t[{1}] {2}\n'.format(
+                ticket, issue.fields.status.name, issue.fields.summary))
+
     def create_bug(self, arger, args, out=sys.stdout):
         """
         create bug in Jira
@@ -302,9 +404,11 @@ class Commands(object):
         """
 
         arger.add_argument('text')
-        summary = arger.parse_args(args).text
+        arger.add_argument('-d', '--description')
+        opts = arger.parse_args(args)
+        summary = opts.text
 
-        bug = self.jira.create_issue(summary, summary)
+        bug = self.jira.create_issue(summary, opts.description or summary)
 
         out.write('bug created: {0}\n'.format(bug.key))
 
@@ -316,12 +420,68 @@ class Commands(object):
         """
 
         arger.add_argument('text')
-        summary = arger.parse_args(args).text
+        arger.add_argument('-d', '--description')
+        opts = arger.parse_args(args)
+        summary = opts.text
 
-        bug = self.jira.create_issue(summary, summary, kind="Task")
+        bug = self.jira.create_issue(summary, opts.description or summary, kind="Task")
 
         out.write('task created: {0}\n'.format(bug.key))
 
+    def import_issues(self, arger, args, out=sys.stdout):
+        """
+        create many Jira issues from an NDJSON or CSV file (or stdin)
+        Each record has a summary and optionally a description, type and
+        assignee.  The created keys are written out in input order.
+        """
+
+        arger.add_argument('file', nargs='?', default='-')
+        arger.add_argument('--format', choices=['ndjson', 'csv'])
+        opts = arger.parse_args(args)
+        if not opts.format:
+            opts.format = 'csv' if opts.file.endswith('.csv') else 'ndjson'
+
+        if opts.file == '-':
+            source = sys.stdin
+        else:
+            source = open(opts.file)
+        try:
+            if opts.format == 'csv':
+                records = list(csv.DictReader(source))
+            else:
+                records = []
+                for line in source:
+                    if not line.strip():
+                        continue
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as e:
+                        records.append(e)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        # rows that can't be submitted are reported in place:
+        results = [None] * len(records)
+        rows = []
+        for n, record in enumerate(records):
+            if isinstance(record, Exception):
+                results[n] = (None, 'invalid JSON: {0}'.format(record))
+            elif not isinstance(record, dict) or not record.get('summary'):
+                results[n] = (None, 'a summary is required')
+            else:
+                rows.append((n, record))
+
+        created = self.jira.create_issues([row for _, row in rows])
+        for (n, _), result in zip(rows, created):
+            results[n] = result
+
+        for n, (key, error) in enumerate(results, 1):
+            if key:
+                out.write('{0}\n'.format(key))
+            else:
+                out.write('row {0} failed: {1}\n'.format(n, error))
+
     def close_ticket(self, arger, args, out=sys.stdout):
         """
         close issue
@@ -337,6 +497,153 @@ class Commands(object):
         self.jira.close_issue(opts.ticket)
         out.write('Ticket {0} closed.\n'.format(opts.ticket))
 
+    def move(self, arger, args, out=sys.stdout):
+        """
+        move ticket to a status via the shortest path through the workflow
+        """
+
+        arger.add_argument('-t', '--ticket')
+        arger.add_argument('--to', dest='status', required=True)
+        arger.add_argument('-c', '--comment')
+        opts = arger.parse_args(args)
+        if not opts.ticket:
+            opts.ticket = _get_ticket_from_dir()
+            if not opts.ticket:
+                raise TicketSpecificationException("ticket number required")
+
+        taken = self.jira.move_issue(opts.ticket, opts.status,
+                                     comment=opts.comment)
+        if taken:
+            out.write('Ticket {0} moved to "{1}" ({2}).\n'.format(
+                opts.ticket, opts.status, ' -> '.join(taken)))
+        else:
+            out.write('Ticket {0} is already "{1}".\n'.format(
+                opts.ticket, opts.status))
+
+    def bulk(self, arger, args, out=sys.stdout):
+        """
+        run an operation on every ticket matched by a JQL query or filter
+        """
+        operations = {
+            'assign': lambda key: self.jira.assign_issue(key, opts.person),
+            'take': lambda key: self.jira.assign_issue(
+                key, self.config['jira']['username']),
+            'add_watcher': lambda key: self.jira.add_watcher(key,
+                                                             opts.person),
+            'add_comment': lambda key: self.jira.add_comment(
+                key, ' '.join(opts.comment)),
+            'close_ticket': lambda key: self.jira.close_issue(key),
+            # only paths already learned (e.g. by 'air move') are followed,
+            # rather than every ticket searching for others to learn from:
+            'move': lambda key: self.jira.move_issue(key, opts.status,
+                                                     explore=False),
+        }
+        arger.add_argument('operation', choices=sorted(operations))
+        selection = arger.add_mutually_exclusive_group(required=True)
+        selection.add_argument('--jql')
+        selection.add_argument('--filter')
+        arger.add_argument('-p', '--person')
+        arger.add_argument('--to', dest='status')
+        arger.add_argument('-j', '--jobs', type=int,
+                           default=self.config['jira'].get('bulk_workers', 8))
+        arger.add_argument('comment', nargs='*')
+        opts = arger.parse_args(args)
+        if opts.operation in ('assign', 'add_watcher') and not opts.person:
+            arger.error('{0} requires --person'.format(opts.operation))
+        if opts.operation == 'move' and not opts.status:
+            arger.error('move requires --to')
+
+        jql = opts.jql
+        if opts.filter:
+            jql = self.jira.filter_jql(opts.filter)
+        keys = self.jira.query_keys(jql)
+        out.write('{0} {1} tickets...\n'.format(opts.operation, len(keys)))
+
+        failures = BulkExecutor(opts.jobs, out=out).run(
+            keys, operations[opts.operation])
+        out.write('{0} succeeded, {1} failed.\n'.format(
+            len(keys) - len(failures), len(failures)))
+        if failures:
+            out.write('Failed: {0}\n'.format(
+                ' '.join([key for key, _ in failures])))
+
+    def batch(self, arger, args, out=sys.stdout):
+        """
+        run many air commands, one per line of a file (or stdin)
+        Lines are split like a shell would ('#' starts a comment) and may
+        start with 'air'.  All the commands share one set of logged-in
+        clients and caches.  They run in order and stop at the first
+        failure unless --keep-going is given; with --jobs they run
+        concurrently (so only use it for lines that don't depend on each
+        other) and their output is written in input order.
+        """
+        arger.add_argument('file', nargs='?', default='-')
+        arger.add_argument('-j', '--jobs', type=int, default=1)
+        arger.add_argument('-k', '--keep-going', action='store_true')
+        opts = arger.parse_args(args)
+
+        source = sys.stdin if opts.file == '-' else open(opts.file)
+        try:
+            lines = []
+            for number, line in enumerate(source, 1):
+                words = shlex.split(line, comments=True)
+                if words and words[0] == 'air':
+                    words = words[1:]
+                if words:
+                    lines.append((number, words))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        dispatcher = Dispatcher(self.config, commands=self)
+        # 'air batch --no-cache' applies to every line, whichever thread
+        # runs it (the caches it bypassed were created by then):
+        bypass = [x for x in self._caches(existing=True) if not x.enabled]
+
+        def run(line, output):
+            number, words = line
+            try:
+                with bypassed(bypass):
+                    dispatcher.go(out=output, argv=['air'] + words)
+            except SystemExit as e:
+                if e.code:
+                    return number, 'exit status {0}'.format(e.code)
+            except Exception as e:
+                return number, '{0}'.format(e).strip()
+            return number, None
+
+        failures = []
+        if opts.jobs > 1:
+            from multiprocessing.pool import ThreadPool
+
+            def buffered(line):
+                output = StringIO()
+                return run(line, output) + (output.getvalue(),)
+
+            pool = ThreadPool(min(opts.jobs, len(lines)) or 1)
+            try:
+                for number, error, text in pool.imap(buffered, lines):
+                    out.write(text)
+                    if error is not None:
+                        failures.append(number)
+                        out.write('line {0}: failed: {1}\n'.format(
+                            number, error))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for line in lines:
+                number, error = run(line, out)
+                if error is not None:
+                    failures.append(number)
+                    out.write('line {0}: failed: {1}\n'.format(
+                        number, error))
+                    if not opts.keep_going:
+                        break
+
+        if failures:
+            sys.exit(1)
+
     def add_comment(self, arger, args, out=sys.stdout):
         """
         add comment to Jira ticket
@@ -357,56 +664,171 @@ class Commands(object):
         """
         list tickets that are ready for review
         """
-        tickets = self.jira.list_reviewable()
+        _add_index_arguments(arger, self.config['jira'])
+        opts = arger.parse_args(args)
+        tickets = self.jira.indexed_issues('review', sync=opts.sync,
+                                           fresh=opts.fresh, stream=True)
 
-        for key, summary in [(x.key, x.fields.summary) for x in tickets]:
-            out.write('{0}:\t{1}\n'.format(key, summary))
+        keys = []
+        for ticket in tickets:
+            out.write('{0}:\t{1}\n'.format(ticket.key, ticket.summary))
+            keys.append(ticket.key)
+        self._start_prefetch(keys, opts.prefetch)
 
     def list_tickets(self, arger, args, out=sys.stdout):
         """
         list Jira tickets assigned to me
         """
-        tickets = self.jira.list_issues()
+        _add_index_arguments(arger, self.config['jira'])
+        opts = arger.parse_args(args)
+        tickets = self.jira.indexed_issues('list', sync=opts.sync,
+                                           fresh=opts.fresh, stream=True)
+
+        keys = []
+        for ticket in tickets:
+            out.write('{0}:\t{1}\n'.format(ticket.key, ticket.summary))
+            keys.append(ticket.key)
+        self._start_prefetch(keys, opts.prefetch)
 
-        for key, summary in [(x.key, x.fields.summary) for x in tickets]:
+    def search(self, arger, args, out=sys.stdout):
+        """
+        search tickets air has already seen, without asking Jira
+        """
+        arger.add_argument('words', nargs='+')
+        arger.add_argument('-n', '--limit', type=int, default=20)
+        opts = arger.parse_args(args)
+
+        for key, summary in self.jira.index.search(opts.words, opts.limit):
             out.write('{0}:\t{1}\n'.format(key, summary))
 
+    def refresh_filters(self, arger, args, out=sys.stdout):
+        """
+        refresh the cached list of favourite Jira filters
+        """
+        filters = self.jira.favourite_filters(refresh=True)
+        for name in sorted(filters):
+            out.write('{0}:\t{1}\n'.format(name, filters[name]))
+
+    def _prefetch(self, arger, args, out=sys.stdout):
+        """
+        this method is only intended for use by the list commands
+        Fetches tickets, their transitions and the list of branches into
+        the caches so that a command on one of them starts quickly.
+        """
+        arger.add_argument('tickets', nargs='+')
+        opts = arger.parse_args(args)
+        self.jira.prefetch(opts.tickets)
+        if self.svn:
+            self.svn.get_branches()
+
+    def _start_prefetch(self, tickets, count):
+        """
+        Start prefetching the first 'count' tickets in the background.
+        """
+        tickets = tickets[:max(0, count)]
+        # there's nowhere to keep them with the cache turned off:
+        if tickets and self.jira.issue_cache.enabled:
+            _spawn_detached(['_prefetch'] + tickets)
+
     def _complete_tickets(self, arger, args, out=sys.stdout):
         """
         this method is only intended for use by the shell completion mechanism
         """
-        tickets = self.jira.list_issues()
-        for key, summary in [(x.key, x.fields.summary) for x in tickets]:
-            out.write('{0}:{1}\n'.format(key, summary))
+        tickets = self.jira.indexed_issues('list')
+        for ticket in tickets:
+            out.write('{0}:{1}\n'.format(ticket.key, ticket.summary))
+
+    def _complete_filters(self, arger, args, out=sys.stdout):
+        """
+        this method is only intended for use by the shell completion mechanism
+        """
+        for name in sorted(self.jira.favourite_filters()):
+            out.write('{0}\n'.format(name))
 
     def _complete_subcommands(self, arger, args, out=sys.stdout):
         """
         this method is only intended for use by the shell completion mechanism
         """
-        def _cleanup(docs):
-            if not docs:
-                return 'No description given'
-            docs = docs.split('\n')
-            return docs[1].strip()
+        for line in self._subcommands():
+            out.write('{0}\n'.format(line))
+
+    def _subcommands(self):
+        """
+        Returns 'name:description' for every public subcommand.
+        """
+        registry = command_registry(type(self))
+        return ['{0}:{1}'.format(x, registry[x]) for x in sorted(registry)
+                if not x.startswith('_')]
 
-        methods = [(x[0], _cleanup(x[1].__doc__))
-                   for x in inspect.getmembers(self) if
-                   inspect.ismethod(x[1])]
+    def _complete_all(self, arger, args, out=sys.stdout):
+        """
+        this method is only intended for use by the shell completion mechanism
 
-        # remove private methods:
-        names = [x for x in methods if not x[0].startswith('_')]
-        for x, y in names:
-            out.write('{0}:{1}\n'.format(x, y))
+        Writes every kind of completion data as 'kind<TAB>value' lines from
+        an on-disk cache.  When the cache is older than the [completion]
+        'ttl' a detached 'air _complete_all --refresh' brings it up to date
+        for next time.
+        """
+        arger.add_argument('--refresh', action='store_true')
+        opts = arger.parse_args(args)
+
+        # the same cache settings ('cache = off', 'cache_dir') as Jira's:
+        jira = self.config.get('jira', {})
+        cache = make_cache(jira, 'completion')
+        # completions depend on the configuration in use:
+        key = '{0}|{1}|{2}'.format(jira.get('server'), jira.get('username'),
+                                   jira.get('project'))
+        data = None if opts.refresh else cache.get(key)
+        if data is None:
+            data = self._completion_data(refresh=opts.refresh)
+            cache.put(key, data)
+        elif cache.age(key) > float(
+                self.config.get('completion', {}).get('ttl', 600)):
+            # mark the entry fresh first so that other shells don't start
+            # refreshing it too:
+            cache.touch(key)
+            _spawn_detached(['_complete_all', '--refresh'])
+
+        for kind in ('subcommand', 'ticket', 'person', 'filter'):
+            for value in data.get(kind, []):
+                out.write('{0}\t{1}\n'.format(kind, value))
+
+    def _completion_data(self, refresh=False):
+        data = {'subcommand': self._subcommands() + [
+            '{0}:alias for {1}'.format(x, y)
+            for x, y in sorted(self.config.get('aliases', {}).items())]}
+        if self.jira:
+            data['ticket'] = ['{0}:{1}'.format(x.key, x.summary) for x in
+                              self.jira.indexed_issues('list', sync=refresh)]
+            data['person'] = self.jira.users.complete(
+                self.config['jira']['project'], refresh=refresh)
+            data['filter'] = sorted(
+                self.jira.favourite_filters(refresh=refresh))
+        return data
 
     def _complete_persons(self, arger, args, out=sys.stdout):
         """
         this method is only intended for use by the shell completion mechanism
         """
+        arger.add_argument('prefix', nargs='?', default='')
+        arger.add_argument('--refresh', action='store_true')
+        opts = arger.parse_args(args)
         project = self.config['jira']['project']
 
-        users = self.jira.server.search_assignable_users_for_issues(
-            '', project=project, maxResults=500)
-        out.write('\n'.join([user.name for user in users]))
+        users = self.jira.users.complete(project, opts.prefix,
+                                         refresh=opts.refresh)
+        out.write('\n'.join(users))
+
+
+def _add_index_arguments(arger, config):
+    arger.add_argument('--sync', action='store_true',
+                       help='fetch changes from Jira before listing')
+    arger.add_argument('--fresh', action='store_true',
+                       help='reload the list from Jira from scratch')
+    arger.add_argument('--prefetch', type=int, metavar='N',
+                       default=int(config.get('prefetch', 0)),
+                       help='fetch the first N tickets listed (and their '
+                       'transitions and branches) in the background')
 
 
 def _make_branch_name(issue, text):
@@ -419,15 +841,51 @@ def _make_branch_name(issue, text):
 def _parse_ticket(string):
     match = re.search('URL(.*)', string)
     branch = os.path.basename(match.group(1))
-    ticket = re.search('^(\S+-\d+)_', branch).group(1)
+    ticket = re.search('^({0})_'.format(TICKET_PATTERN), branch).group(1)
     return ticket
 
 
+def _find_tickets(text):
+    '''
+    Returns the issue keys mentioned in text, in order of first mention.
+    '''
+    tickets = []
+    pattern = r'(?<![A-Za-z0-9])({0})(?!\d)'.format(TICKET_PATTERN)
+    for ticket in re.findall(pattern, text):
+        if ticket not in tickets:
+            tickets.append(ticket)
+    return tickets
+
+
+def _spawn_detached(args):
+    '''
+    Run 'air' with args in the background, detached from this process and
+    its terminal.
+    '''
+    if os.path.isfile(sys.argv[0]):
+        command = [sys.executable, os.path.abspath(sys.argv[0])]
+    else:
+        command = ['air']
+    # nobody waits for it, so it shouldn't take up the daemon (which runs
+    # one command at a time):
+    env = dict(os.environ, AIR_NO_DAEMON='1')
+    devnull = open(os.devnull, 'r+')
+    try:
+        subprocess.Popen(command + args, stdin=devnull, stdout=devnull,
+                         stderr=devnull, close_fds=True,
+                         preexec_fn=os.setsid, env=env)
+    except OSError:
+        pass
+    finally:
+        devnull.close()
+
+
 def _get_ticket_from_dir():
 
     #TODO: how to handle non-svn Git dirs?
 
     if os.path.isdir('.svn'):
+        from sh import svn
         cmd = svn.info()
     elif os.path.isdir('.git'):
         # Git is optional, but only if git is available.
@@ -455,44 +913,136 @@ def _get_parser(names):
     return arger, subparsers_dict
 
 
-class Dispatcher(object):
+def config_paths(directory='.'):
+    '''
+    Returns the configuration files used in a directory; later ones
+    override earlier ones.
+    '''
+    return [os.path.expanduser('~/.airrc'),
+            os.path.abspath(os.path.join(directory, '.airrc'))]
+
+
+def load_config(directory='.'):
+    '''
+    Read the configuration for a directory: ~/.airrc, overridden by a
+    .airrc in the directory.
+    '''
+    from configobj import ConfigObj
+    home, local = config_paths(directory)
+    config = ConfigObj(home)
+    if local != home:
+        config.merge(ConfigObj(local))
+    return config
+
+
+def config_stamp(directory='.'):
+    '''
+    Returns something that changes whenever the configuration for a
+    directory does: the directory's .airrc and the modification times of
+    the configuration files.
+    '''
+    home, local = config_paths(directory)
+    stamp = [local]
+    for path in (home, local):
+        try:
+            stamp.append(os.path.getmtime(path))
+        except OSError:
+            stamp.append(None)
+    return tuple(stamp)
 
-    def __init__(self, config):
-        self.config = config
-        self.commands = Commands(config)
-        self.aliases = config['aliases']
 
-    def completion(self):
-        methods = [x for x in inspect.getmembers(self.commands) if
-                   inspect.ismethod(x[1])]
+# the arguments every subcommand method takes (see Commands):
+COMMAND_ARGS = ['self', 'arger', 'args', 'out']
 
-        names = [x[0] for x in methods] + self.aliases.keys()
-        names.remove('__init__')
-        print (' '.join(names))
+_registries = dict()
 
-    def go(self, out=sys.stdout):
-        # get the names of the functions in the Commands class to use
-        # as names for  subcommands for the parser:
-        # TODO: use filter() here?
-        methods = [x for x in inspect.getmembers(self.commands) if
-                   inspect.ismethod(x[1])]
 
-        names = [x[0] for x in methods] + self.aliases.keys()
-        names.remove('__init__')
-        arger, subparser_dict = _get_parser(names)
+def command_registry(cls=Commands):
+    """
+    Returns a dict of subcommand name -> one-line description for every
+    method of cls that has the subcommand signature.  It's worked out once
+    per class and version of this package.
+    """
+    key = (cls, __version__)
+    if key not in _registries:
+        registry = dict()
+        for name, method in inspect.getmembers(cls, inspect.ismethod):
+            if inspect.getargspec(method).args != COMMAND_ARGS:
+                continue
+            docs = (method.__doc__ or '').strip()
+            registry[name] = docs.split('\n')[0].strip() if docs else \
+                'No description given'
+        _registries[key] = registry
+    return _registries[key]
 
-        opts = arger.parse_known_args()
-        subcommand = opts[0].command
-        # get the subparser for the particular subcommand:
-        arger = subparser_dict[subcommand]
+
+class Dispatcher(object):
+
+    def __init__(self, config, commands=None):
+        self.config = config
+        self.commands = commands or Commands(config)
+        self.aliases = config.get('aliases', {})
+        self.registry = command_registry(type(self.commands))
+        # catch aliases that point at nothing before anything is run:
+        invalid = sorted([x for x, y in self.aliases.items()
+                          if y not in self.registry])
+        if invalid:
+            raise InvalidAliasException(
+                'aliases for unknown commands: {0}'.format(', '.join(
+                    ['{0}={1}'.format(x, self.aliases[x]) for x in invalid])))
+
+    def names(self):
+        return sorted(self.registry.keys() + self.aliases.keys())
+
+    def completion(self):
+        print (' '.join(self.names()))
+
+    def go(self, out=sys.stdout, argv=None):
+        argv = sys.argv if argv is None else argv
+        subcommand = argv[1] if len(argv) > 1 else None
+        if subcommand not in self.registry and \
+                subcommand not in self.aliases:
+            # no (known) subcommand, or asking for help: only now is a
+            # parser for every subcommand needed, to report on them all:
+            arger, _ = _get_parser(self.names())
+            arger.parse_args(argv[1:])
+            return 0
+
+        # only the chosen subcommand gets a parser:
+        arger = argparse.ArgumentParser(
+            prog='{0} {1}'.format(os.path.basename(argv[0]), subcommand))
 
         # substitute the real command:
         if subcommand in self.aliases:
             subcommand = self.aliases[subcommand]
 
+        args = argv[2:]
+        # '--no-cache' is accepted by every subcommand and bypasses the
+        # on-disk issue and branch caches for this run.  Only this thread
+        # stops using them, so commands running alongside (e.g. the other
+        # lines of 'air batch -j') aren't affected:
+        no_cache = '--no-cache' in args
+        args = [x for x in args if x != '--no-cache']
+
         # call the subcommand, pass the argument parser object
-        if hasattr(self.commands, subcommand):
-            getattr(self.commands, subcommand)(arger,
-                                               args=sys.argv[2:], out=out)
+        jira = self.commands.jira
+        with bypassed(self.commands._caches() if no_cache else []):
+            if jira:
+                with jira.unit_of_work():
+                    getattr(self.commands, subcommand)(arger, args=args,
+                                                       out=out)
+            else:
+                getattr(self.commands, subcommand)(arger, args=args, out=out)
+
+        # with AIR_DEBUG set, report how many Jira round trips were avoided
+        # and how long requests to each endpoint have taken:
+        if os.environ.get('AIR_DEBUG'):
+            if self.commands.jira:
+                sys.stderr.write('jira: round trips saved: {0}\n'.format(
+                    ', '.join(['{0}={1}'.format(k, v) for k, v in
+                               sorted(self.commands.jira.saved_calls.items())
+                               ])))
+            for line in latency_stats.report():
+                sys.stderr.write('latency: {0}\n'.format(line))
 
         return 0
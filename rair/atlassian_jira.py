@@ -1,14 +1,64 @@
 #!/usr/bin/env python
 
-# installed:
-from jira.client import JIRA
-from jira.resources import Issue
+# stdlib
+import contextlib
+import inspect
+import json
+import math
+import os.path
+import re
+import threading
+import time
+
+# the jira package (and requests under it) is slow to import, so it's only
+# imported where it's used:
+from cache import cache_directory
+from cache import make_cache
+from index import IssueIndex
+from resilience import resilient_session
+from transport import DEFAULT_CONNECT_TIMEOUT
+from transport import DEFAULT_READ_TIMEOUT
+from transport import make_timeout
+from transport import socket_timeout
+from users import UserDirectory
+from workflow import Workflow
 
 
 class InvalidJiraStatusException(Exception):
     pass
 
 
+class UnknownFilterException(Exception):
+    pass
+
+
+class BulkCreateException(Exception):
+    pass
+
+
+_ORDER_BY = re.compile(r'\s+ORDER\s+BY\s+', re.IGNORECASE)
+
+
+def _split_order_by(jql):
+    '''
+    Split JQL into its condition and its 'ORDER BY' clause (which can't be
+    wrapped in parentheses and combined with other conditions).
+    '''
+    parts = _ORDER_BY.split(' ' + jql, 1)
+    condition = parts[0].strip()
+    order = ' ORDER BY {0}'.format(parts[1].strip()) if len(parts) > 1 else ''
+    return condition, order
+
+
+def _jql_since(seconds):
+    '''
+    A JQL date for 'this many seconds ago'.  Relative dates are measured
+    back from the server's clock, so this doesn't depend on the client's
+    clock or time zone agreeing with the server's.
+    '''
+    return '-{0}m'.format(int(math.ceil(seconds / 60.0)))
+
+
 '''
 class JiraIssue(object):
 
@@ -27,22 +77,205 @@ class JiraIssue(object):
 '''
 
 
+class IssueRecord(object):
+    '''
+    A compact, read-only view of an issue, used where only a few fields are
+    wanted (listing and completion) instead of a full jira Issue resource.
+    Fields that weren't requested are None.
+    '''
+
+    __slots__ = ('key', 'summary', 'status', 'assignee', 'updated')
+
+    # the Jira fields a record can hold:
+    FIELDS = ('summary', 'status', 'assignee', 'updated')
+
+    def __init__(self, key, summary=None, status=None, assignee=None,
+                 updated=None):
+        self.key = key
+        self.summary = summary
+        self.status = status
+        self.assignee = assignee
+        self.updated = updated
+
+    def __repr__(self):
+        return '<IssueRecord {0}>'.format(self.key)
+
+    @classmethod
+    def from_raw(cls, raw):
+        '''
+        Build a record from the JSON of an issue in a search result.
+        '''
+        fields = raw.get('fields') or dict()
+        status = fields.get('status')
+        assignee = fields.get('assignee')
+        return cls(raw['key'],
+                   summary=fields.get('summary'),
+                   status=status['name'] if status else None,
+                   assignee=assignee['name'] if assignee else None,
+                   updated=fields.get('updated'))
+
+
 class Jira(object):
     '''
     Encapsulates interaction with Jira server.
     '''
 
+    # the JQL for each listing when the config gives neither a query nor a
+    # filter:
+    DEFAULT_JQL = {
+        'list': 'assignee=currentUser() \
+                AND status != Closed AND status != Resolved',
+        'review': 'status IN ("Ready for Review", "In Review") \
+            ORDER BY priority, updatedDate ASC',
+    }
+
     def __init__(self, config):
         self.config = config
         self.options = {'server': config['server']}
-        self.server = JIRA(self.options,
-                basic_auth=(config['username'], config['password']))
+        # logging in costs round trips, so it's put off until the server is
+        # first needed (which may be by several commands at once, with 'air
+        # batch -j'):
+        self._server = None
+        self._server_lock = threading.Lock()
+        # issues are cached on disk for an hour and revalidated against the
+        # server's 'updated' timestamp before use:
+        self.issue_cache = make_cache(config, 'issue', ttl=3600,
+                                      max_entries=1000)
+        # identity map, only active inside unit_of_work(): every lookup of
+        # an issue (and of its transitions) during one command shares the
+        # same object until a write to that issue invalidates it:
+        self._issues = None
+        self._transitions = None
+        self._units = 0
+        # units of work may be started by several threads (air batch -j):
+        self._units_lock = threading.Lock()
+        # the workflow graph learned from listing transitions; it rarely
+        # changes so it's kept on disk for a week:
+        self.workflow = Workflow(make_cache(config, 'workflow',
+                                            ttl=7 * 24 * 3600))
+        # favourite filters (name -> JQL) are cached for a day:
+        self.filter_cache = make_cache(config, 'filter', ttl=24 * 3600)
+        # assignable users per project, refreshed daily:
+        self.users = UserDirectory(self, make_cache(config, 'user',
+                                                    ttl=24 * 3600))
+        self.index = IssueIndex(config.get('index', os.path.join(
+            cache_directory(config), 'index.sqlite')))
+        # round trips avoided thanks to the identity map, by kind:
+        self.saved_calls = {'issue': 0, 'transitions': 0}
+
+    @property
+    def server(self):
+        if self._server is not None:
+            return self._server
+        with self._server_lock:
+            if self._server is None:
+                self._server = self._login()
+        return self._server
+
+    def _login(self):
+        '''
+        Returns a new client logged in to the server.
+        '''
+        from jira.client import JIRA
+        connect = float(self.config.get('connect_timeout',
+                                        DEFAULT_CONNECT_TIMEOUT))
+        read = float(self.config.get('read_timeout', DEFAULT_READ_TIMEOUT))
+        options = {'basic_auth': (self.config['username'],
+                                  self.config['password'])}
+        # logging in makes requests before the session can be wrapped
+        # below, so they need a timeout of their own: passed to the client
+        # if it takes one, and the sockets' default otherwise:
+        if 'timeout' in inspect.getargspec(JIRA.__init__).args:
+            options['timeout'] = make_timeout(connect, read)
+        with socket_timeout(max(connect, read)):
+            server = JIRA(self.options, **options)
+        # give every request made through the client (and the issues it
+        # returns) a timeout, retries and latency stats:
+        server._session = resilient_session(server._session, self.config)
+        return server
+
+    @contextlib.contextmanager
+    def unit_of_work(self):
+        '''
+        Share issue and transition lookups for the duration of a command.
+        Nested units of work share the outermost one.
+        '''
+        with self._units_lock:
+            if not self._units:
+                self._issues = dict()
+                self._transitions = dict()
+                self.saved_calls = dict.fromkeys(self.saved_calls, 0)
+            self._units += 1
+        try:
+            yield self
+        finally:
+            with self._units_lock:
+                self._units -= 1
+                if not self._units:
+                    self._issues = None
+                    self._transitions = None
 
     def query(self, jql_query):
         '''
         Run a JQL query.
         '''
-        return self.server.search_issues(jql_query)
+        return list(self.iter_query(jql_query))
+
+    def iter_query(self, jql_query):
+        '''
+        Run a JQL query, yielding issues as each page of results arrives.
+        '''
+        for raw in self._search(jql_query):
+            yield self._issue_from_raw(raw)
+
+    def query_keys(self, jql_query):
+        '''
+        Returns the keys of the issues matching a JQL query.
+        '''
+        return [x['key'] for x in self._search(jql_query, ['updated'])]
+
+    def _search(self, jql_query, fields=None, validate=True):
+        '''
+        Yields the raw JSON of every issue matching a JQL query.  The first
+        page is fetched on its own to learn the total; the remaining pages
+        are then fetched concurrently (by at most 'search_workers' threads)
+        and yielded in order.  Without 'validate' Jira ignores values in the
+        query that don't exist (such as the keys of deleted issues) instead
+        of rejecting it.
+        '''
+        page_size = int(self.config.get('page_size', 100))
+        workers = int(self.config.get('search_workers', 4))
+
+        first = self._search_page(jql_query, 0, page_size, fields, validate)
+        self.index.add_documents(first['issues'])
+        for raw in first['issues']:
+            yield raw
+        # the server may cap the page size below what we asked for:
+        page_size = first.get('maxResults') or page_size
+        starts = range(len(first['issues']), first['total'], page_size)
+        if not starts or not first['issues']:
+            return
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(workers, len(starts)))
+        try:
+            pages = pool.imap(lambda start: self._search_page(
+                jql_query, start, page_size, fields, validate), starts)
+            for page in pages:
+                self.index.add_documents(page['issues'])
+                for raw in page['issues']:
+                    yield raw
+        finally:
+            pool.terminate()
+
+    def _search_page(self, jql_query, start, size, fields=None,
+                     validate=True):
+        if fields is not None and not isinstance(fields, basestring):
+            fields = ','.join(fields)
+        return self.server.search_issues(jql_query, startAt=start,
+                                         maxResults=size, fields=fields,
+                                         validate_query=validate,
+                                         json_result=True)
 
     def create_issue(self, summary, description, kind='Bug'):
         '''
@@ -52,112 +285,399 @@ class Jira(object):
         new_issue = self.server.create_issue(
             project={'key': self.config['project']},
             summary=summary,
-            description=summary,
+            description=description,
 #       components=[{'id': '10301', 'name': 'Server Engineering'}],
             assignee={'name': self.config['username']},
             issuetype={'name': kind})
 
         return new_issue
 
+    def create_issues(self, rows, chunk_size=50):
+        '''
+        Create many Jira issues through the bulk-create endpoint, one
+        request per chunk of rows.  Each row is a dict with a 'summary' and
+        optionally a 'description', 'type' (defaults to Bug) and 'assignee'
+        (defaults to me).
+
+        Returns a (key, error) tuple for every row, in the same order as the
+        rows; one of the two is None.
+        '''
+        rows = list(rows)
+        results = []
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            updates = [{'fields': {
+                'project': {'key': self.config['project']},
+                'summary': row['summary'],
+                'description': row.get('description') or row['summary'],
+                'assignee': {'name': row.get('assignee') or
+                             self.config['username']},
+                'issuetype': {'name': row.get('type') or 'Bug'},
+            }} for row in chunk]
+            response = self.server._session.post(
+                self.server._get_url('issue/bulk'),
+                data=json.dumps({'issueUpdates': updates}))
+            try:
+                data = json.loads(response.content)
+            except ValueError:
+                data = dict()
+            if response.status_code not in (200, 201) and \
+                    'errors' not in data:
+                raise BulkCreateException(
+                    'bulk create failed with status {0}: {1}'.format(
+                        response.status_code, response.content))
+
+            errors = dict()
+            for error in data.get('errors', []):
+                messages = error.get('elementErrors', {})
+                messages = messages.get('errorMessages', []) + [
+                    '{0}: {1}'.format(field, message) for field, message in
+                    sorted(messages.get('errors', {}).items())]
+                errors[error['failedElementNumber']] = '; '.join(messages)
+            # the created issues are listed in order, skipping failed rows:
+            created = iter(data.get('issues', []))
+            for n in range(len(chunk)):
+                if n in errors:
+                    results.append((None, errors[n] or 'not created'))
+                else:
+                    results.append((next(created)['key'], None))
+        return results
+
     def close_issue(self, ticket):
+        '''
+        Resolve an issue.  If the learned workflow knows a path to
+        'Resolved' it is followed; otherwise progress is stopped (if
+        necessary) and the issue resolved.  Returns the names of the
+        transitions taken.
+        '''
+        try:
+            return self.move_issue(ticket, 'Resolved', explore=False)
+        except InvalidJiraStatusException:
+            pass
+
+        taken = []
         issue = self.get_issue(ticket)
-        transitions = self.server.transitions(issue)
-        transition_names = [x['name'] for x in transitions]
-        if 'Stop Progress' in transition_names:
-            self.transition_issue(ticket, status='Stop Progress')
-            transitions = self.server.transitions(issue)
-            transition_names = [x['name'] for x in transitions]
+        if self.find_transition(issue, 'Stop Progress') is not None:
+            issue = self.transition_issue(ticket, status='Stop Progress')
+            taken.append('Stop Progress')
 
-        if 'Resolve Issue' in transition_names:
+        if self.find_transition(issue, 'Resolve Issue') is not None:
             self.transition_issue(ticket, status='Resolve Issue')
-            return self.get_issue(ticket)
+            taken.append('Resolve Issue')
+            return taken
         else:
+            transition_names = [x['name'] for x in
+                                self.get_transitions(issue)]
             raise InvalidJiraStatusException(
                     '\nattempt to close ticket failed. \
             \nValid transitions: {0}'.format(', '.join(transition_names)))
 
-    def transition_issue(self, ticket, status='Resolve Issue'):
+    def transition_issue(self, ticket, status='Resolve Issue', comment=None,
+                         fields=None):
+        '''
+        Make a transition on an issue.  A comment and fields (e.g. a
+        resolution) can be given; they're sent in the same request as the
+        transition so the change is made in one step on the server.
+        '''
 
         issue = self.get_issue(ticket)
-        transitions = self.server.transitions(issue)
-        transition_names = [x['name'] for x in transitions]
-        if status not in transition_names:
+        edge = self.find_transition(issue, status)
+        if edge is None:
+            transition_names = [x['name'] for x in
+                                self.get_transitions(issue)]
             raise InvalidJiraStatusException(
             '\n\'{0}\' is not a valid status for this Jira issue. \
             \nValid transitions: {1}'.format(
                 status, ', '.join(transition_names)))
-        _id = [x['id'] for x in transitions if x['name'] == status][0]
         # transition it:
-        self.server.transition_issue(issue, _id)
+        try:
+            self._apply_transition(issue, edge, comment=comment,
+                                   fields=fields)
+        finally:
+            self.invalidate(issue.key)
         return self.get_issue(ticket)
 
-#users = self.jira.server.search_assignable_users_for_issues('',
-#        project='CIGNAINC', maxResults=500)
+    def move_issue(self, ticket, status, comment=None, explore=True):
+        '''
+        Move an issue to the given status along the shortest path through
+        the learned workflow.  Only the transitions themselves are sent to
+        the server; a comment is sent along with the last one.  Returns the
+        names of the transitions taken.
+
+        If no path is known yet (and 'explore' is set) the statuses on the
+        way whose transitions haven't been learned are learned from other
+        issues in them; nothing is written until a path is found.
+        '''
+        issue = self.get_issue(ticket)
+        project, kind, current = self._node(issue)
+        path = self.workflow.path(project, kind, current, status)
+        if path is None:
+            # we may not have seen this status yet (or what we know about it
+            # is out of date), so ask the server and try again:
+            self._learn_transitions(issue)
+            path = self.workflow.path(project, kind, current, status)
+        if path is None and explore:
+            path = self._explore(project, kind, current, status)
+        if path is None:
+            raise InvalidJiraStatusException(
+            '\nno known path from \'{0}\' to \'{1}\' for this Jira issue. \
+            \nValid transitions: {2}'.format(current, status, ', '.join(
+                x['name'] for x in self.workflow.transitions(
+                    project, kind, current))))
+
+        taken = []
+        try:
+            for n, edge in enumerate(path, 1):
+                self._apply_transition(
+                    issue, edge, status=current,
+                    comment=comment if n == len(path) else None)
+                taken.append(edge['name'])
+                current = edge['to']
+        finally:
+            if path:
+                self.invalidate(issue.key)
+        return taken
+
+    def _explore(self, project, kind, start, target):
+        '''
+        Look for a path between two statuses by learning the transitions
+        leaving the statuses reachable from 'start' that haven't been seen
+        yet.  They're listed for some other issue of the same project and
+        type in each status, so only reads are made.  Returns the path, or
+        None if there isn't one.
+        '''
+        looked = set()
+        while True:
+            unknown = [x for x in self.workflow.reachable(project, kind, start)
+                       if x not in looked and
+                       self.workflow.transitions(project, kind, x) is None]
+            if not unknown:
+                return None
+            for name in unknown:
+                looked.add(name)
+                found = self._search_page(
+                    'project = "{0}" AND issuetype = "{1}" AND status = "{2}"'
+                    .format(project, kind, name), 0, 1, ['status'])
+                if found['issues']:
+                    self.workflow.learn(project, kind, name,
+                                        self.server.transitions(
+                                            found['issues'][0]['key']))
+            path = self.workflow.path(project, kind, start, target)
+            if path is not None:
+                return path
+
+    def _node(self, issue):
+        '''
+        The workflow node an issue is at: (project, issue type, status).
+        '''
+        return (issue.fields.project.key, issue.fields.issuetype.name,
+                issue.fields.status.name)
+
+    def _learn_transitions(self, issue):
+        '''
+        List the transitions available to an issue and record them in the
+        workflow under its status.
+        '''
+        transitions = self.server.transitions(issue)
+        project, kind, status = self._node(issue)
+        return self.workflow.learn(project, kind, status, transitions)
+
+    def _apply_transition(self, issue, edge, status=None, comment=None,
+                          fields=None):
+        '''
+        Send a single transition (with an optional comment and fields) to
+        the server.  'status' is the status the issue is in when the
+        transition is made (defaults to its current one).
+        '''
+        from jira.exceptions import JIRAError
+        project, kind, current = self._node(issue)
+        try:
+            self.server.transition_issue(issue, edge['id'], fields=fields,
+                                         comment=comment)
+        except JIRAError:
+            # what we learned about this status is out of date:
+            self.workflow.forget(project, kind, status or current)
+            raise
 
     def add_watcher(self, ticket, person):
 
         issue = self.get_issue(ticket)
         self.server.add_watcher(issue, person)
+        self.invalidate(issue.key)
         return issue
 
-    def list_reviewable(self):
+    def list_reviewable(self, fields=None, stream=False):
         '''
-        if a JQL query is defined in the config use it.  If not:
-            if a named filter is defined in the config use it.  If not:
-                use the predefined filter.
+        List issues that are ready for review.  If 'fields' (names from
+        IssueRecord.FIELDS) are given only those are fetched and
+        IssueRecords are returned.  With 'stream' an iterator is returned
+        that yields issues as they arrive.
         '''
+        jql = self._configured_jql('review')
+        return self._list(jql, fields, stream)
 
-        section = self.config.get('review', None)
-        jql = 'status IN ("Ready for Review", "In Review") \
-            ORDER BY priority, updatedDate ASC'
-
-        if not section:
-            return self.query(jql)
-
-        jql_config = section.get('jql', None)
-        if jql_config:
-            return self.query(jql_config)
-
-        filter_name = section.get('filter', None)
+    def list_issues(self, fields=None, stream=False):
+        '''
+        List my issues.  If 'fields' (names from IssueRecord.FIELDS) are
+        given only those are fetched and IssueRecords are returned.  With
+        'stream' an iterator is returned that yields issues as they arrive.
+        '''
+        jql = self._configured_jql('list')
+        return self._list(jql, fields, stream)
 
-        if filter_name:
-            filters = self.server.favourite_filters()
-            jql = [x.jql for x in filters if x.name == filter_name][0]
-            return self.query(jql)
+    def _list(self, jql, fields, stream):
+        if fields:
+            issues = (IssueRecord.from_raw(raw)
+                      for raw in self._search(jql, fields))
+        else:
+            issues = self.iter_query(jql)
+        if stream:
+            return issues
+        return list(issues)
 
-        return self.query(jql)
+    def indexed_issues(self, name, sync=False, fresh=False, stream=False):
+        '''
+        List the issues of a view ('list' or 'review') from the local index
+        as IssueRecords.  The index is synced first if asked to; it's loaded
+        from scratch if it has never been loaded (or was loaded from other
+        JQL) or 'fresh' is given.  With 'stream' an iterator is returned
+        which, on a full load, yields records as each page arrives.
+        '''
+        jql = self._configured_jql(name)
+        view = self._view_id(name)
+        watermark = None if fresh else self.index.watermark(view, jql)
+        if watermark is None:
+            issues = self._load_view(view, jql)
+        else:
+            if sync:
+                self._sync_changes(view, jql, watermark)
+            issues = (IssueRecord(*row) for row in self.index.rows(view))
+        if stream:
+            return issues
+        return list(issues)
+
+    def sync_view(self, name, fresh=False):
+        '''
+        Bring the local index of a view up to date.  After the first full
+        load only issues updated since the last sync are fetched.
+        '''
+        jql = self._configured_jql(name)
+        view = self._view_id(name)
+        watermark = None if fresh else self.index.watermark(view, jql)
+        if watermark is None:
+            for _ in self._load_view(view, jql):
+                pass
+        else:
+            self._sync_changes(view, jql, watermark)
 
-    def list_issues(self):
+    def _load_view(self, view, jql):
+        '''
+        Load a view from scratch, yielding its records as they arrive.  The
+        index is replaced once they all have.
+        '''
+        started = time.time()
+        records = []
+        for raw in self._search(jql, IssueRecord.FIELDS):
+            record = IssueRecord.from_raw(raw)
+            records.append(record)
+            yield record
+        self.index.replace(view, jql, records, started)
+
+    def _sync_changes(self, view, jql, watermark, chunk_size=100):
+        '''
+        Apply the changes to a view since the sync at 'watermark'.
+        '''
+        started = time.time()
+        # JQL times only have minute precision, so look back a little
+        # further than the last sync:
+        since = _jql_since(started - watermark +
+                           float(self.config.get('sync_margin', 300)))
+        condition, order = _split_order_by(jql)
+        if condition:
+            changed_jql = '({0}) AND updated >= "{1}"{2}'.format(
+                condition, since, order)
+        else:
+            changed_jql = 'updated >= "{0}"{1}'.format(since, order)
+        records = [IssueRecord.from_raw(x) for x in
+                   self._search(changed_jql, IssueRecord.FIELDS)]
+
+        # issues that no longer match (or no longer exist) are found by
+        # asking which of the ones we have still match:
+        removed = []
+        known = sorted(self.index.keys(view))
+        if condition:
+            for start in range(0, len(known), chunk_size):
+                chunk = known[start:start + chunk_size]
+                matching = set(x['key'] for x in self._search(
+                    'key in ({0}) AND ({1})'.format(', '.join(chunk),
+                                                    condition),
+                    ['updated'], validate=False))
+                removed.extend([x for x in chunk if x not in matching])
+        self.index.update(view, jql, records, removed, started)
+
+    def _view_id(self, name):
+        # views are per server and user since different directories can
+        # use different Jira configurations:
+        return '{0}|{1}|{2}'.format(self.config['server'],
+                                    self.config['username'], name)
+
+    def _configured_jql(self, section_name):
         '''
         if a JQL query is defined in the config use it.  If not:
             if a named filter is defined in the config use it.  If not:
                 use the predefined filter.
         '''
 
-        section = self.config.get('list', None)
-        jql = 'assignee=currentUser() \
-                AND status != Closed AND status != Resolved'
+        jql = self.DEFAULT_JQL[section_name]
+        section = self.config.get(section_name, None)
 
         if not section:
-            return self.query(jql)
+            return jql
 
         jql_config = section.get('jql', None)
         if jql_config:
-            return self.query(jql_config)
+            return jql_config
 
         filter_name = section.get('filter', None)
 
         if filter_name:
-            filters = self.server.favourite_filters()
-            jql = [x.jql for x in filters if x.name == filter_name][0]
-            return self.query(jql)
+            return self.filter_jql(filter_name)
 
-        return self.query(jql)
+        return jql
+
+    def filter_jql(self, filter_name):
+        '''
+        Returns the JQL of one of my favourite filters.
+        '''
+        filters = self.favourite_filters()
+        if filter_name not in filters:
+            # it may have been created since the cache was filled:
+            filters = self.favourite_filters(refresh=True)
+        if filter_name not in filters:
+            raise UnknownFilterException(
+                '\n\'{0}\' is not one of your favourite filters.'.format(
+                    filter_name))
+        return filters[filter_name]
+
+    def favourite_filters(self, refresh=False):
+        '''
+        Returns a dict of the names of my favourite filters and their JQL.
+        This comes from the on-disk cache unless it's stale or 'refresh' is
+        given.
+        '''
+        key = '{0}|{1}'.format(self.config['server'], self.config['username'])
+        filters = None if refresh else self.filter_cache.get(key)
+        if filters is None:
+            filters = dict([(x.name, x.jql)
+                            for x in self.server.favourite_filters()])
+            self.filter_cache.put(key, filters)
+        return filters
 
     def delete_issue(self, ticket):
 
         issue = self.get_issue(ticket)
         issue.delete()
+        self.invalidate(issue.key)
 
     def assign_issue(self, ticket, assignee):
         '''
@@ -165,6 +685,7 @@ class Jira(object):
         '''
         issue = self.get_issue(ticket)
         self.server.assign_issue(issue, assignee)
+        self.invalidate(issue.key)
         return issue
 
     def add_comment(self, ticket, comment):
@@ -173,13 +694,137 @@ class Jira(object):
         '''
         issue = self.get_issue(ticket)
         self.server.add_comment(issue, comment)
+        self.invalidate(issue.key)
         return issue
 
     def get_issue(self, ticket):
         '''
         Given an issue name, returns a Jira instance of that issue.
         '''
-        if isinstance(ticket, Issue):
-            ticket = ticket.key
+        ticket = getattr(ticket, 'key', ticket)
+        key = '{0}'.format(ticket).upper()
+
+        if self._issues is not None and key in self._issues:
+            self.saved_calls['issue'] += 1
+            return self._issues[key]
+
+        raw = self.issue_cache.get(key)
+        if raw is not None:
+            # revalidate cheaply by fetching only the 'updated' field:
+            current = self.server.issue(key, fields='updated')
+            if current.fields.updated == raw['fields'].get('updated'):
+                self.issue_cache.touch(key)
+                return self._remember(key, self._issue_from_raw(raw))
+
+        issue = self.server.issue(key)
+        self.issue_cache.put(key, issue.raw)
+        self.index.add_documents([issue.raw])
+        return self._remember(key, issue)
+
+    def get_issues(self, tickets, chunk_size=50):
+        '''
+        Given issue names, returns Jira instances of those issues (in the
+        same order) using one 'key in (...)' search per chunk of names
+        instead of one request per issue.  Issues that don't exist are left
+        out (as are names that aren't issue keys).
+        '''
+        keys = []
+        for ticket in tickets:
+            ticket = getattr(ticket, 'key', ticket)
+            key = '{0}'.format(ticket).upper()
+            if key not in keys:
+                keys.append(key)
+
+        found = dict()
+        if self._issues is not None:
+            for key in keys:
+                if key in self._issues:
+                    self.saved_calls['issue'] += 1
+                    found[key] = self._issues[key]
+        missing = [x for x in keys if x not in found]
+
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            # without validation Jira leaves out keys that don't exist (or
+            # aren't issue keys at all, like 'UTF-8') instead of rejecting
+            # the whole search; all fields are asked for so that what's
+            # cached is the same as what get_issue would fetch:
+            for raw in self._search('key in ({0})'.format(', '.join(chunk)),
+                                    '*all', validate=False):
+                self.issue_cache.put(raw['key'], raw)
+                found[raw['key']] = self._remember(
+                    raw['key'], self._issue_from_raw(raw))
+
+        return [found[x] for x in keys if x in found]
+
+    def get_transitions(self, ticket, refresh=False):
+        '''
+        Given an issue (or issue name), returns the transitions currently
+        available for it.  The learned workflow graph is used when it knows
+        the issue's status (unless 'refresh' is set).
+        '''
+        return self._get_transitions(self.get_issue(ticket), refresh)[0]
 
-        return self.server.issue('{0}'.format(ticket))
+    def find_transition(self, ticket, name):
+        '''
+        Returns the transition called 'name' available to an issue, or None.
+        If it isn't among the transitions known from the workflow graph
+        (which may be out of date) they're listed by the server once more.
+        '''
+        issue = self.get_issue(ticket)
+        transitions, listed = self._get_transitions(issue)
+        if not listed and name not in [x['name'] for x in transitions]:
+            transitions, _ = self._get_transitions(issue, refresh=True)
+        matches = [x for x in transitions if x['name'] == name]
+        return matches[0] if matches else None
+
+    def _get_transitions(self, issue, refresh=False):
+        '''
+        Returns the transitions available to an issue and whether they were
+        just listed by the server.
+        '''
+        if (not refresh and self._transitions is not None and
+                issue.key in self._transitions):
+            self.saved_calls['transitions'] += 1
+            return self._transitions[issue.key]
+
+        transitions = None
+        if not refresh:
+            transitions = self.workflow.transitions(*self._node(issue))
+        if transitions is None:
+            result = (self._learn_transitions(issue), True)
+        else:
+            self.saved_calls['transitions'] += 1
+            result = (transitions, False)
+        if self._transitions is not None:
+            self._transitions[issue.key] = result
+        return result
+
+    def prefetch(self, tickets):
+        '''
+        Fetch issues, and the transitions available to them, into the
+        on-disk caches ahead of their being used.
+        '''
+        with self.unit_of_work():
+            for issue in self.get_issues(tickets):
+                self.get_transitions(issue)
+
+    def _remember(self, key, issue):
+        if self._issues is not None:
+            self._issues[key] = issue
+        return issue
+
+    def invalidate(self, ticket):
+        '''
+        Forget everything known about an issue after writing to it.
+        '''
+        ticket = getattr(ticket, 'key', ticket)
+        key = '{0}'.format(ticket).upper()
+        if self._issues is not None:
+            self._issues.pop(key, None)
+            self._transitions.pop(key, None)
+        self.issue_cache.delete(key)
+
+    def _issue_from_raw(self, raw):
+        from jira.resources import Issue
+        return Issue(self.server._options, self.server._session, raw=raw)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# stdlib
+import sys
+
+
+class BulkExecutor(object):
+    '''
+    Runs an operation on many issues at once on a bounded pool of threads,
+    reporting progress and any failure for each issue as it completes.
+    '''
+
+    def __init__(self, workers=8, out=sys.stdout):
+        self.workers = int(workers)
+        self.out = out
+
+    def run(self, keys, operation):
+        '''
+        Call operation(key) for every key.  Returns a list of (key,
+        exception) tuples for the keys that failed.
+        '''
+        keys = list(keys)
+        if not keys:
+            return []
+
+        def attempt(key):
+            try:
+                operation(key)
+                return key, None
+            except Exception as e:
+                return key, e
+
+        from multiprocessing.pool import ThreadPool
+        failures = []
+        pool = ThreadPool(max(1, min(self.workers, len(keys))))
+        try:
+            results = pool.imap_unordered(attempt, keys)
+            for done, (key, error) in enumerate(results, 1):
+                if error is None:
+                    self.out.write('[{0}/{1}] {2}: done\n'.format(
+                        done, len(keys), key))
+                else:
+                    failures.append((key, error))
+                    self.out.write('[{0}/{1}] {2}: failed: {3}\n'.format(
+                        done, len(keys), key, '{0}'.format(error).strip()))
+                self.out.flush()
+        finally:
+            pool.close()
+            pool.join()
+        return failures
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+# stdlib
+import contextlib
+import errno
+import json
+import os
+import thread
+import threading
+import time
+
+
+class DiskCache(object):
+    '''
+    A small persistent key/value store.  Each entry is a JSON file in a
+    directory; an entry's age is the modification time of its file.
+
+    Entries older than ``ttl`` seconds are treated as missing (a ``ttl`` of
+    None means entries never expire).  When more than ``max_entries`` files
+    exist the least recently used ones are removed.
+
+    A cache can be turned off ('enabled') or, with bypassed(), ignored by
+    one thread (i.e. one command) while other threads keep using it.
+    '''
+
+    def __init__(self, directory, ttl=None, max_entries=None, enabled=True):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._enabled = enabled
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return self._enabled and not getattr(self._local, 'bypassed', 0)
+
+    @enabled.setter
+    def enabled(self, value):
+        self._enabled = value
+
+    def _path(self, key):
+        # keys are things like issue keys or filter names; keep the
+        # filename safe:
+        name = ''.join([c if c.isalnum() or c in '-_.' else '_'
+                        for c in '{0}'.format(key)])
+        return os.path.join(self.directory, name + '.json')
+
+    def _ensure_directory(self):
+        try:
+            os.makedirs(self.directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    def age(self, key):
+        '''
+        Returns the age in seconds of the entry for key or None if there is
+        no entry.
+        '''
+        try:
+            return time.time() - os.path.getmtime(self._path(key))
+        except OSError:
+            return None
+
+    def get(self, key, default=None):
+        '''
+        Returns the value stored for key, or default if there's no fresh
+        entry.
+        '''
+        if not self.enabled:
+            return default
+        age = self.age(key)
+        if age is None:
+            return default
+        if self.ttl is not None and age > float(self.ttl):
+            self.delete(key)
+            return default
+        try:
+            with open(self._path(key), 'r') as cache_file:
+                return json.load(cache_file)
+        except (IOError, ValueError):
+            # unreadable or half-written; treat as a miss
+            self.delete(key)
+            return default
+
+    def touch(self, key):
+        '''
+        Mark an entry as fresh (and recently used) without rewriting it.
+        '''
+        try:
+            os.utime(self._path(key), None)
+        except OSError:
+            pass
+
+    def put(self, key, value):
+        '''
+        Store value (which must be JSON-serializable) under key.
+        '''
+        if not self.enabled:
+            return
+        self._ensure_directory()
+        path = self._path(key)
+        # write to a temporary file and rename so that readers never see a
+        # partially written entry (writers may be in several threads or
+        # processes):
+        tmp_path = '{0}.{1}.{2}.tmp'.format(path, os.getpid(),
+                                            thread.get_ident())
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(value, cache_file)
+        os.rename(tmp_path, path)
+        self.evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in self._entries():
+            self.delete(name[:-len('.json')])
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [x for x in names if x.endswith('.json')]
+
+    def evict(self):
+        '''
+        Remove the least recently used entries beyond max_entries.
+        '''
+        if not self.max_entries:
+            return
+        names = self._entries()
+        excess = len(names) - int(self.max_entries)
+        if excess <= 0:
+            return
+        paths = [os.path.join(self.directory, x) for x in names]
+        aged = []
+        for path in paths:
+            try:
+                aged.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        for _, path in sorted(aged)[:excess]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+@contextlib.contextmanager
+def bypassed(caches):
+    '''
+    Treat caches as turned off in the calling thread (only) while the block
+    runs.  Entries can still be deleted, so writes made meanwhile still
+    invalidate what's cached.
+    '''
+    caches = list(caches)
+    for cache in caches:
+        cache._local.bypassed = getattr(cache._local, 'bypassed', 0) + 1
+    try:
+        yield
+    finally:
+        for cache in caches:
+            cache._local.bypassed -= 1
+
+
+def cache_directory(config):
+    '''
+    Returns the base directory for on-disk caches for a config section.
+    '''
+    return os.path.expanduser(config.get('cache_dir', '~/.air/cache'))
+
+
+def make_cache(config, namespace, ttl=None, max_entries=None):
+    '''
+    Build a DiskCache for a config section.  'ttl' and 'max_entries' are
+    the defaults used when the config doesn't override them.
+    '''
+    ttl = config.get('{0}_cache_ttl'.format(namespace), ttl)
+    max_entries = config.get('{0}_cache_size'.format(namespace), max_entries)
+    enabled = config.get('cache', 'on') not in ('off', 'false', 'False', False)
+    return DiskCache(os.path.join(cache_directory(config), namespace),
+                     ttl=float(ttl) if ttl is not None else None,
+                     max_entries=int(max_entries) if max_entries else None,
+                     enabled=enabled)
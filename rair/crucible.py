@@ -1,20 +1,51 @@
-import requests
+import gzip
 import json
+import tempfile
+import threading
+import time
+import uuid
+
+from resilience import resilient_session
+from transport import DEFAULT_POOL_SIZE
+from transport import make_session
+from transport import session_settings
+
+
+# patches bigger than this (in bytes) are uploaded as a file rather than as
+# JSON unless the config's 'patch_upload_limit' says otherwise:
+PATCH_UPLOAD_LIMIT = 20 * 1024 * 1024
+# request bodies are built in memory up to this size and on disk beyond it:
+SPOOL_SIZE = 1024 * 1024
+# how much of a patch is encoded at a time:
+CHUNK_SIZE = 64 * 1024
 
 
 class SendRequestException(Exception):
-    pass
+
+    def __init__(self, message, status_code=None):
+        Exception.__init__(self, message)
+        self.status_code = status_code
 
 
 class Review(object):
     '''
     Represents a crucible review -- an object of this class is returned by the
     'create_review' method from the Crucible class.
+
+    The review's details (its state, reviewers and so on) are fetched with
+    one request when first needed and kept.  They're revalidated (with a
+    conditional request, where FishEye supports ETags) once they're older
+    than MAX_AGE seconds and dropped after anything that changes the review.
     '''
 
+    MAX_AGE = 60
+
     def __init__(self, crucible, review_id):
         self.crucible = crucible
         self.review_id = review_id
+        self._details = None
+        self._etag = None
+        self._fetched = None
 
     def __str__(self):
         return self.review_id
@@ -39,50 +70,137 @@ class Review(object):
         return '/'.join([self.crucible.uri_api_base, 'reviews-v1',
             self.review_id])
 
+    @property
+    def uri_details(self):
+        return '/'.join([self.crucible.uri_api_base, 'reviews-v1',
+            self.review_id, 'details'])
+
+    @property
+    def details(self):
+        """
+        The review's details, as Crucible's detailedReviewData.
+        """
+        if self._details is None or \
+                time.time() - self._fetched > self.MAX_AGE:
+            self.refresh()
+        return self._details
+
+    def refresh(self):
+        """
+        Fetch the review's details now, unless the server says the ones
+        already fetched haven't changed.
+        """
+        etag = self._etag if self._details is not None else None
+        details, etag = self.crucible._conditional_get(self.uri_details,
+                                                       etag)
+        if details is not None:
+            self._details = details
+        self._etag = etag
+        self._fetched = time.time()
+        return self
+
+    def invalidate(self):
+        """
+        Forget the review's details (after changing the review).
+        """
+        self._details = None
+        self._etag = None
+        return self
+
+    @property
+    def state(self):
+        return self.details['state']
+
     @property
     def uri_frontend(self):
         return '/'.join([self.crucible.config['server'], 'cru',
             self.review_id])
 
+    @property
+    def uri_reviewers(self):
+        return '/'.join([self.crucible.uri_api_base, 'reviews-v1',
+            self.review_id, 'reviewers'])
+
+    def add_reviewers(self, reviewers):
+        """
+        Add reviewers to the review with one request.
+        """
+        if not reviewers:
+            return self
+        auth, headers = self.crucible._setup_auth_n_headers()
+        # the reviewers resource takes a comma separated list of names:
+        headers = dict(headers, **{'Content-Type': 'text/plain'})
+        self.crucible._send_request('post', self.uri_reviewers,
+                auth=auth, headers=headers, body=','.join(reviewers),
+                expected_status_code=204)
+        return self.invalidate()
+
     def remove_reviewers(self, reviewers):
+        """
+        Remove reviewers from the review.  Crucible only removes one
+        reviewer per request so the requests are sent concurrently.
+        """
+        reviewers = list(reviewers)
+        if not reviewers:
+            return self
         auth, headers = self.crucible._setup_auth_n_headers()
-        for reviewer in reviewers:
-            uri = '/'.join([self.crucible.uri_api_base, 'reviews-v1',
-                self.review_id, 'reviewers', reviewer])
+
+        def remove(reviewer):
+            uri = '/'.join([self.uri_reviewers, reviewer])
             self.crucible._send_request('DELETE', uri,
                 auth=auth, headers=headers, data={},
                 expected_status_code=204)
-        return self
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, min(self.crucible.pool_size,
+                                     len(reviewers))))
+        try:
+            # map() re-raises the first failure once they're all done:
+            pool.map(remove, reviewers)
+        finally:
+            pool.close()
+            pool.join()
+        return self.invalidate()
+
+    def reconcile_reviewers(self, wanted, ignore=()):
+        """
+        Make the reviewers of the review the 'wanted' ones (less the
+        review's creator, who can't review it), leaving any reviewers in
+        'ignore' alone.  This takes one request to find the reviewers, one
+        to add any missing ones and one concurrent round of removals.
+
+        **Returns**
+            The (sorted) lists of reviewers added and removed.
+        """
+        current = set(self.reviewers)
+        wanted = set(wanted) - set([self.crucible.user_name])
+        added = sorted(wanted - current)
+        removed = sorted(current - wanted - set(ignore))
+        self.add_reviewers(added)
+        self.remove_reviewers(removed)
+        return added, removed
 
     @property
     def reviewers(self):
-        auth, headers = self.crucible._setup_auth_n_headers()
-        uri = '/'.join([self.crucible.uri_api_base, 'reviews-v1',
-            self.review_id, 'reviewers'])
-        response_data = self.crucible._send_request('GET', uri,
-                auth=auth, headers=headers, data={},
-                expected_status_code=200)
-        return [x['userName'] for x in response_data['reviewer']]
+        reviewers = self.details.get('reviewers') or dict()
+        return [x['userName'] for x in reviewers.get('reviewer', [])]
 
     def start(self):
         auth, headers = self.crucible._setup_auth_n_headers()
         self.crucible._send_request('post', self.uri_start,
                 auth=auth, headers=headers, data={},
                 expected_status_code=200)
-        return self
+        return self.invalidate()
 
     def abandon(self):
         auth, headers = self.crucible._setup_auth_n_headers()
         self.crucible._send_request('post', self.uri_abandon,
                 auth=auth, headers=headers, data={},
                 expected_status_code=200)
-        return self
+        return self.invalidate()
 
     def get(self):
-        auth, headers = self.crucible._setup_auth_n_headers()
-        self.data = self.crucible._send_request('GET', self.uri_get,
-                auth=auth, headers=headers, data={},
-                expected_status_code=200)
+        self.data = self.refresh().details
         return self
 
     def finish(self):
@@ -92,23 +210,134 @@ class Review(object):
         self.crucible._send_request('post', uri,
                 auth=auth, headers=headers, data={},
                 expected_status_code=200)
-        return self
+        return self.invalidate()
+
+    @property
+    def uri_add_file(self):
+        return '/'.join([self.crucible.uri_api_base, 'reviews-v1',
+            self.review_id, 'addFile'])
 
     def add_patch(self, data):
         """
+        Add a patch (e.g. from Subversion.diff) to the review.  The request
+        body is written out a chunk at a time (to disk once it's big) and
+        gzipped if the 'gzip_uploads' option is on.  Patches bigger than
+        'patch_upload_limit' are uploaded as a file instead.
+
         **Parameters**
-            ``data``
+            ``data``: the text of the patch
 
         **Returns**
+            The data Crucible returns about the patch (or file).
 
         **Raises**
+            SendRequestException
+        """
+        if len(data) > self.crucible.patch_upload_limit:
+            return self.add_patch_file(data)
+        if self.crucible.gzip_uploads:
+            try:
+                return self._post_patch(data, compress=True)
+            except SendRequestException as e:
+                if e.status_code not in (400, 415):
+                    raise
+                # the server doesn't take compressed requests; stop trying:
+                self.crucible.gzip_uploads = False
+        return self._post_patch(data, compress=False)
+
+    def _post_patch(self, data, compress):
+        auth, headers = self.crucible._setup_auth_n_headers()
+        body, size = _json_patch_body(data, compress)
+        headers = dict(headers, **{'Content-Length': str(size)})
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+        try:
+            return self.crucible._send_request('post', self.uri_patch,
+                    auth=auth, headers=headers, body=body)
+        finally:
+            body.close()
+
+    def add_patch_file(self, data, name=None):
+        """
+        Upload a patch to the review as a file (a multipart/form-data
+        request), for patches too big to send as JSON.
         """
         auth, headers = self.crucible._setup_auth_n_headers()
-        patch_data = {'patch': data}
-        response_data = self.crucible._send_request('post',
-                self.uri_patch, auth=auth,
-                headers=headers, data=patch_data)
-        return response_data
+        name = name or '{0}.patch'.format(self.review_id)
+        body, size, content_type = _multipart_body('file', name, data)
+        headers = dict(headers, **{'Content-Type': content_type,
+                                   'Content-Length': str(size)})
+        try:
+            return self.crucible._send_request('post', self.uri_add_file,
+                    auth=auth, headers=headers, body=body)
+        finally:
+            body.close()
+
+
+def _chunks(text, size=CHUNK_SIZE):
+    """
+    Split text into pieces of about 'size', breaking only after newlines (so
+    that multi-byte characters are never split).
+    """
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start + size)
+        end = len(text) if end == -1 else end + 1
+        yield text[start:end]
+        start = end
+
+
+def _json_patch_body(data, compress=False):
+    """
+    Write {"patch": data} as JSON, a chunk of the patch at a time, to a
+    temporary file (optionally gzipped).
+
+    **Returns**
+        The file, at its start, and its size.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    stream = gzip.GzipFile(fileobj=body, mode='wb') if compress else body
+    stream.write('{"patch": "')
+    for chunk in _chunks(data):
+        # the JSON string for the chunk, without its quotes:
+        stream.write(json.dumps(chunk)[1:-1])
+    stream.write('"}')
+    if compress:
+        # (this leaves the file itself open)
+        stream.close()
+    size = body.tell()
+    body.seek(0)
+    return body, size
+
+
+def _multipart_body(field, name, data):
+    """
+    Write data as the file 'name' in a multipart/form-data request body,
+    to a temporary file.
+
+    **Returns**
+        The file, at its start, its size and its content type.
+    """
+    boundary = uuid.uuid4().hex
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    body.write('--{0}\r\n'.format(boundary))
+    body.write('Content-Disposition: form-data; name="{0}"; '
+               'filename="{1}"\r\n'.format(field, name))
+    body.write('Content-Type: text/x-patch\r\n\r\n')
+    for chunk in _chunks(data):
+        body.write(chunk)
+    body.write('\r\n--{0}--\r\n'.format(boundary))
+    size = body.tell()
+    body.seek(0)
+    return (body, size,
+            'multipart/form-data; boundary={0}'.format(boundary))
+
+
+def _as_list(value):
+    # ConfigObj gives a string for a single value and a list for several:
+    if isinstance(value, basestring):
+        return [value]
+    return list(value)
 
 
 def get_review_id(review_data):
@@ -131,6 +360,40 @@ class Crucible(object):
         self.uri_server = config['server']
         self.key = config['key']
         self.uri_api_base = self.uri_server + '/rest-service'
+        # reviewers that mustn't be removed from reviews (e.g. deleted users
+        # that a project adds by default, which the API can't remove):
+        self.ignore_reviewers = _as_list(config.get('ignore_reviewers', []))
+        self._auth_n_headers = None
+        self._session = None
+        # commands run by 'air batch -j' may create the session at once:
+        self._session_lock = threading.Lock()
+        # Review objects by id, so that their details are shared:
+        self._reviews = dict()
+        self.timeout = None
+        self.pool_size = int(config.get('pool_size', DEFAULT_POOL_SIZE))
+        self.gzip_uploads = config.get('gzip_uploads', 'off') in (
+            'on', 'true', 'True', True)
+        self.patch_upload_limit = int(config.get('patch_upload_limit',
+                                                 PATCH_UPLOAD_LIMIT))
+
+    @property
+    def session(self):
+        """
+        The HTTP session every request to Crucible is sent through, so that
+        connections to the server are reused.  Its pool size and timeouts
+        come from 'pool_size', 'connect_timeout' and 'read_timeout' in the
+        [crucible] config, and GETs are retried (and hedged) as set up by
+        'retries', 'backoff' and 'hedge_after' (see resilience.py).
+        """
+        if self._session is not None:
+            return self._session
+        with self._session_lock:
+            if self._session is None:
+                auth, headers = self._setup_auth_n_headers()
+                _, self.timeout = session_settings(self.config)
+                self._session = resilient_session(
+                    make_session(auth, headers, self.pool_size), self.config)
+        return self._session
 
     def uri_review(self):
         return '/'.join([self.uri_api_base, 'reviews-v1'])
@@ -143,10 +406,14 @@ class Crucible(object):
 
         **Raises**
         """
-        auth = requests.auth.HTTPBasicAuth(self.user_name, self.password)
-        headers = {'Content-Type': 'application/json',
-                'Accept': 'application/json'}
-        return auth, headers
+        if self._auth_n_headers is None:
+            # requests is slow to import, so only do it when it's needed:
+            import requests
+            auth = requests.auth.HTTPBasicAuth(self.user_name, self.password)
+            headers = {'Content-Type': 'application/json',
+                    'Accept': 'application/json'}
+            self._auth_n_headers = auth, headers
+        return self._auth_n_headers
 
     def get_review_from_issue(self, issue):
 
@@ -158,16 +425,22 @@ class Crucible(object):
                 auth=auth, headers=headers, params=params, data={},
                 expected_status_code=200)
         review_id = get_review_id(response_data['reviewData'][0])
-        return Review(self, review_id)
+        return self.review(review_id)
+
+    def review(self, review_id):
+        """
+        Returns the Review for an id.  It's the same object for as long as
+        this object lives, so its details are only fetched once.
+        """
+        if review_id not in self._reviews:
+            self._reviews[review_id] = Review(self, review_id)
+        return self._reviews[review_id]
 
     def get_review(self, review_id):
-        auth, headers = self.crucible._setup_auth_n_headers()
-        uri = '/'.join([self.crucible.uri_api_base, 'reviews-v1',
-            review_id])
-        response_data = self._send_request('GET', uri,
-                auth=auth, headers=headers, data={},
-                expected_status_code=200)
-        return response_data
+        """
+        Returns the details of a review.
+        """
+        return self.review(review_id).details
 
     def create_review(self, participants, allow_others=True, jira_ticket=None):
         """
@@ -222,19 +495,15 @@ class Crucible(object):
                 expected_status_code=201)
 
         review_id = get_review_id(response_data)
-        review = Review(self, review_id)
-        # remove any reviewers that we didn't add:
-        other_reviewers = list(set(review.reviewers) - set(participants))
-        # this is ridiculous, but the MMSANDBOX Crucible project is set up to
-        # automatically add him, even though it shows him as a deleted user so
-        # the API won't let us remove him from the review:
-        if 'norman.harman' in other_reviewers:
-            other_reviewers.remove('norman.harman')
-        review.remove_reviewers(other_reviewers)
+        review = self.review(review_id)
+        # remove any reviewers that we didn't add (e.g. ones the project adds
+        # by default):
+        review.reconcile_reviewers(participants,
+                                   ignore=self.ignore_reviewers)
         return review
 
     def _send_request(self, method, url, auth=None, params=None, headers=None, data=None,
-            expected_status_code=200):
+            expected_status_code=200, body=None):
         """
         **Parameters**
             ``method``
@@ -243,29 +512,61 @@ class Crucible(object):
             ``headers``
             ``data``
             ``expected_status_code``
+            ``body``: sent as is (a string or a file) instead of 'data'
+                encoded as JSON
 
         **Returns**
 
         **Raises**
         """
-        payload_json = json.dumps(data)
+        payload_json = body if body is not None else json.dumps(data)
         #print ('**REQUEST**\nMETHOD: {0}\nURL: {1}\nHEADERS: {2}\nREQUEST DATA: {3}'.format(
         #        method, url, headers, data))
-        response = requests.request(method, url, auth=auth,
-                headers=headers, data=payload_json, params=params)
+        session = self.session
+        response = session.request(method, url, auth=auth,
+                headers=headers, data=payload_json, params=params,
+                timeout=self.timeout)
         #print ('**RESPONSE**\nSTATUS CODE: {0}\nHEADERS: {1}'
         #        '\nCONTENT: {2}'.format(response.status_code,
         #            response.headers, response.content))
-        if response.status_code != expected_status_code:
-            raise SendRequestException('Received an unexpected response.  '
-                    'Expected a response with status code, {0}.  Received {1} '
-                    'instead.'.format(expected_status_code,
-                        response.status_code))
+        _check_status(response, expected_status_code)
         if response.content:
             response_data = json.loads(response.content)
             return response_data
         return None
 
+    def _conditional_get(self, url, etag=None):
+        """
+        **Parameters**
+            ``url``
+            ``etag``: the ETag of the copy already fetched, if any
+
+        **Returns**
+            The (data, ETag) of the resource; the data is None if the
+            server says the copy with the given ETag is still current.
+
+        **Raises**
+            SendRequestException
+        """
+        auth, headers = self._setup_auth_n_headers()
+        if etag:
+            headers = dict(headers, **{'If-None-Match': etag})
+        session = self.session
+        response = session.request('GET', url, auth=auth, headers=headers,
+                timeout=self.timeout)
+        if etag and response.status_code == 304:
+            return None, etag
+        _check_status(response, 200)
+        return json.loads(response.content), response.headers.get('etag')
+
+
+def _check_status(response, expected_status_code):
+    if response.status_code != expected_status_code:
+        raise SendRequestException('Received an unexpected response.  '
+                'Expected a response with status code, {0}.  Received {1} '
+                'instead.'.format(expected_status_code,
+                    response.status_code), response.status_code)
+
 
 #def do_work():
         #Get the user's Atlassian credentials.
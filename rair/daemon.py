@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+
+# stdlib
+import errno
+import json
+import os
+import socket
+import SocketServer
+import stat
+import sys
+import time
+import traceback
+
+from rair import __version__
+
+
+# where the daemon listens (AIR_SOCKET overrides it):
+DEFAULT_SOCKET = '~/.air/daemon.sock'
+
+# the daemon exits after this many seconds without a request unless the
+# [daemon] section of ~/.airrc says otherwise:
+DEFAULT_IDLE_TIMEOUT = 1800
+
+# how long 'air --daemon' waits for the daemon to start listening:
+START_TIMEOUT = 5.0
+
+# how long a command waits for the daemon to finish the one it's running
+# before running itself instead (AIR_DAEMON_WAIT overrides it):
+DEFAULT_WAIT = 0.5
+
+
+def socket_path():
+    return os.path.expanduser(os.environ.get('AIR_SOCKET', DEFAULT_SOCKET))
+
+
+def _send(stream, message):
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+
+class _Stream(object):
+    '''
+    A file-like object that sends what's written to it back to the client
+    as it's written.
+    '''
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self.closed = False
+
+    def write(self, data):
+        if self.closed or not data:
+            return
+        try:
+            _send(self.connection, {'stream': self.name, 'data': data})
+        except (IOError, socket.error):
+            # the client went away; finish the command regardless
+            self.closed = True
+
+    def flush(self):
+        pass
+
+
+class _Handler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        # the client only sends its command once we're ready for it; if it
+        # gave up waiting (and ran the command itself) there's nothing to
+        # read:
+        try:
+            _send(self.wfile, {'ready': True})
+            request = json.loads(self.rfile.readline())
+        except (IOError, ValueError, socket.error):
+            return
+        if request.get('version') != __version__:
+            # the client is from a different version of air; let it run the
+            # command itself and make way for a daemon of its version:
+            _send(self.wfile, {'exit': None})
+            self.server.stopping = True
+            return
+        if request.get('stop'):
+            _send(self.wfile, {'exit': 0})
+            self.server.stopping = True
+            return
+        # JSON strings come back as unicode; commands expect what they'd
+        # get from sys.argv:
+        argv = [x.encode('utf-8') for x in request['argv']]
+        env = dict([(x.encode('utf-8'), y.encode('utf-8'))
+                    for x, y in (request.get('env') or dict()).items()])
+        status = self.server.run(argv, request['cwd'].encode('utf-8'), env,
+                                 _Stream(self.wfile, 'out'),
+                                 _Stream(self.wfile, 'err'))
+        try:
+            _send(self.wfile, {'exit': status})
+        except (IOError, socket.error):
+            pass
+
+    def finish(self):
+        # the client may have gone away before everything was sent:
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except (IOError, socket.error):
+            pass
+
+
+class Daemon(SocketServer.UnixStreamServer):
+    '''
+    Runs air commands sent by the 'air' script over a Unix socket, keeping
+    Dispatchers (and so the logged-in service clients and their caches)
+    between commands.
+
+    Commands run one at a time since each one changes to the client's
+    directory and environment and takes over sys.stdout and sys.stderr
+    while it runs; a client that would have to wait too long for the one
+    before runs its command itself.  A Dispatcher is kept per
+    configuration: editing ~/.airrc or a ./.airrc makes the next command
+    in that directory use a new one.
+    '''
+
+    def __init__(self, path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        self.path = path
+        # handle_request() gives up (and calls handle_timeout) after this:
+        self.timeout = idle_timeout
+        self.stopping = False
+        self.dispatchers = dict()
+        SocketServer.UnixStreamServer.__init__(self, path, _Handler)
+
+    def server_bind(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # only this user may talk to the daemon:
+        umask = os.umask(0o077)
+        try:
+            SocketServer.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def handle_timeout(self):
+        self.stopping = True
+
+    def serve(self):
+        '''
+        Handle requests until there's been none for the idle timeout (or
+        one asks the daemon to stop).
+        '''
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def dispatcher(self, directory):
+        # imported here so that the 'air' script (the client) stays small:
+        from rair import air
+        stamp = air.config_stamp(directory)
+        if stamp not in self.dispatchers:
+            # drop the Dispatcher for the old version of this directory's
+            # configuration:
+            for old in [x for x in self.dispatchers if x[0] == stamp[0]]:
+                del self.dispatchers[old]
+            config = air.load_config(directory)
+            self.dispatchers[stamp] = air.Dispatcher(config) if config \
+                else None
+        return self.dispatchers[stamp]
+
+    def run(self, argv, cwd, env, out, err):
+        '''
+        Run a command (as the 'air' script would) and return its exit
+        status.
+        '''
+        saved = (os.getcwd(), sys.stdout, sys.stderr, dict(os.environ))
+        try:
+            os.chdir(cwd)
+            sys.stdout, sys.stderr = out, err
+            # programs the command runs (svn, a browser) get the client's
+            # PATH, locale, DISPLAY, SSH agent and so on:
+            os.environ.clear()
+            os.environ.update(env)
+            dispatcher = self.dispatcher(cwd)
+            if dispatcher is None:
+                err.write('At least one configuration file must be present '
+                          'to use this program.\n')
+                return 1
+            return dispatcher.go(out=out, argv=argv)
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 1
+        except Exception:
+            err.write(traceback.format_exc())
+            return 1
+        finally:
+            cwd, sys.stdout, sys.stderr, environ = saved
+            os.environ.clear()
+            os.environ.update(environ)
+            try:
+                os.chdir(cwd)
+            except OSError:
+                pass
+
+
+def _connect(path):
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except socket.error:
+        connection.close()
+        return None
+    return connection
+
+
+def _request(message, out=None, err=None, wait=None):
+    '''
+    Send a request to the daemon and copy what it sends back to out and
+    err.  Returns the exit status, or None if no daemon is running, it
+    wasn't ready for the request within 'wait' seconds (if given) or it
+    couldn't run the command.
+    '''
+    connection = _connect(socket_path())
+    if connection is None:
+        return None
+    out = out or sys.stdout
+    err = err or sys.stderr
+    replied = False
+    try:
+        stream = connection.makefile('rw')
+        # a busy daemon only says it's ready once it's done with what it's
+        # running; a timeout here leaves the command to this process:
+        connection.settimeout(wait)
+        if not stream.readline():
+            return None
+        connection.settimeout(None)
+        _send(stream, message)
+        for line in stream:
+            reply = json.loads(line)
+            replied = True
+            if 'exit' in reply:
+                return reply['exit']
+            target = out if reply['stream'] == 'out' else err
+            target.write(reply['data'])
+            target.flush()
+    except (IOError, ValueError, socket.error):
+        pass
+    finally:
+        connection.close()
+    # the daemon went away; only run the command here if it can't have
+    # started it:
+    return 1 if replied else None
+
+
+def _reads_stdin(argv):
+    '''
+    True if a command may read what's piped or redirected to this process
+    (which the daemon can't see).
+    '''
+    if '-' in argv[1:]:
+        return True
+    try:
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError):
+        return False
+    return stat.S_ISFIFO(mode) or stat.S_ISREG(mode)
+
+
+def forward(argv, out=None, err=None):
+    '''
+    Run a command in the daemon.  Returns its exit status, or None when the
+    command must be run in this process instead.
+    '''
+    # commands started in the background (AIR_NO_DAEMON is set for them)
+    # would only keep the daemon from commands someone is waiting on:
+    if _reads_stdin(argv) or os.environ.get('AIR_NO_DAEMON'):
+        return None
+    return _request({'version': __version__, 'argv': list(argv),
+                     'cwd': os.getcwd(), 'env': dict(os.environ)},
+                    out=out, err=err,
+                    wait=float(os.environ.get('AIR_DAEMON_WAIT',
+                                              DEFAULT_WAIT)))
+
+
+def stop():
+    '''
+    Ask a running daemon to exit.  Returns True if one was running.
+    '''
+    return _request({'version': __version__, 'stop': True}) is not None
+
+
+def _idle_timeout():
+    from rair import air
+    config = air.load_config(os.path.expanduser('~'))
+    return float(config.get('daemon', {}).get('idle_timeout',
+                                              DEFAULT_IDLE_TIMEOUT))
+
+
+def start(out=sys.stdout):
+    '''
+    Start a daemon in the background (unless one is already running) and
+    wait for it to listen.  Returns an exit status for 'air --daemon'.
+    '''
+    path = socket_path()
+    connection = _connect(path)
+    if connection is not None:
+        connection.close()
+        out.write('air daemon already running at {0}\n'.format(path))
+        return 0
+    # nothing is listening, so a socket file left behind is stale:
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+    child = os.fork()
+    if child == 0:
+        # detach from the terminal and the process that started us:
+        os.setsid()
+        if os.fork() != 0:
+            os._exit(0)
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        try:
+            Daemon(path, idle_timeout=_idle_timeout()).serve()
+        finally:
+            os._exit(0)
+    os.waitpid(child, 0)
+
+    started = time.time()
+    while time.time() - started < START_TIMEOUT:
+        connection = _connect(path)
+        if connection is not None:
+            connection.close()
+            out.write('air daemon listening at {0}\n'.format(path))
+            return 0
+        time.sleep(0.05)
+    out.write('air daemon failed to start\n')
+    return 1
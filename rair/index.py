@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+# stdlib
+import errno
+import math
+import os
+import re
+import sqlite3
+import threading
+
+
+_TOKEN = re.compile(r'[a-z0-9]+(?:-[0-9]+)?')
+
+# how much a word counts for in each field of an issue:
+FIELD_WEIGHTS = {'key': 4, 'summary': 3, 'description': 1, 'comment': 1}
+
+
+def tokenize(text):
+    '''
+    Split text into lower-case search terms.  Issue keys (e.g. 'ABC-12')
+    are kept whole.
+    '''
+    return _TOKEN.findall((text or '').lower())
+
+
+def _document_fields(raw):
+    '''
+    The searchable text of an issue's JSON, by field.  Only fields present
+    in the JSON are returned (searches often ask for just some fields).
+    '''
+    fields = raw.get('fields') or dict()
+    text = {'key': raw['key']}
+    if 'summary' in fields:
+        text['summary'] = fields['summary']
+    if 'description' in fields:
+        text['description'] = fields['description']
+    if 'comment' in fields:
+        comments = (fields['comment'] or dict()).get('comments') or []
+        text['comment'] = '\n'.join([x.get('body') or '' for x in comments])
+    return text
+
+
+class IssueIndex(object):
+    '''
+    A local SQLite index of the issues matched by named views (e.g. the
+    'list' and 'review' queries from the config).
+
+    Each view remembers the JQL it was loaded from and a watermark (the time
+    of its last sync) so that it can be brought up to date by asking only
+    for issues updated since then.
+
+    It also holds an inverted index over the key, summary, description and
+    comments of every issue it has been given, for offline searching.
+    '''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS issues (
+            key TEXT PRIMARY KEY,
+            summary TEXT,
+            status TEXT,
+            assignee TEXT,
+            updated TEXT
+        );
+        CREATE TABLE IF NOT EXISTS members (
+            view TEXT,
+            key TEXT,
+            position INTEGER,
+            PRIMARY KEY (view, key)
+        );
+        CREATE TABLE IF NOT EXISTS syncs (
+            view TEXT PRIMARY KEY,
+            jql TEXT,
+            watermark REAL
+        );
+        CREATE TABLE IF NOT EXISTS documents (
+            key TEXT PRIMARY KEY,
+            summary TEXT
+        );
+        CREATE TABLE IF NOT EXISTS postings (
+            term TEXT,
+            key TEXT,
+            field TEXT,
+            count INTEGER,
+            PRIMARY KEY (term, key, field)
+        );
+        CREATE INDEX IF NOT EXISTS postings_key ON postings (key, field);
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        # sqlite connections can't be shared between threads:
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        if getattr(self._local, 'db', None) is None:
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            self._local.db = sqlite3.connect(self.path, timeout=30)
+            self._local.db.executescript(self.SCHEMA)
+        return self._local.db
+
+    def watermark(self, view, jql=None):
+        '''
+        Returns the time of the last sync of a view, or None if the view
+        has never been synced or (when 'jql' is given) was loaded from
+        different JQL.
+        '''
+        row = self.db.execute('SELECT jql, watermark FROM syncs '
+                              'WHERE view = ?', (view,)).fetchone()
+        if row is None or (jql is not None and row[0] != jql):
+            return None
+        return row[1]
+
+    def _store(self, records):
+        self.db.executemany(
+            'INSERT OR REPLACE INTO issues '
+            '(key, summary, status, assignee, updated) '
+            'VALUES (?, ?, ?, ?, ?)',
+            [(x.key, x.summary, x.status, x.assignee, x.updated)
+             for x in records])
+
+    def _mark(self, view, jql, synced_at):
+        self.db.execute('INSERT OR REPLACE INTO syncs (view, jql, watermark) '
+                        'VALUES (?, ?, ?)', (view, jql, synced_at))
+
+    def replace(self, view, jql, records, synced_at):
+        '''
+        Replace the contents of a view with records (in display order).
+        '''
+        records = list(records)
+        with self.db:
+            self.db.execute('DELETE FROM members WHERE view = ?', (view,))
+            self._store(records)
+            self.db.executemany(
+                'INSERT INTO members (view, key, position) VALUES (?, ?, ?)',
+                [(view, x.key, n) for n, x in enumerate(records)])
+            self._mark(view, jql, synced_at)
+
+    def update(self, view, jql, records, removed, synced_at):
+        '''
+        Apply an incremental sync: 'records' are issues that (still) match
+        the view and 'removed' are keys that no longer do.
+        '''
+        records = list(records)
+        with self.db:
+            self._store(records)
+            position = self.db.execute(
+                'SELECT COALESCE(MAX(position), -1) FROM members '
+                'WHERE view = ?', (view,)).fetchone()[0]
+            for record in records:
+                position += 1
+                # keep the position of issues already in the view:
+                self.db.execute(
+                    'INSERT OR IGNORE INTO members (view, key, position) '
+                    'VALUES (?, ?, ?)', (view, record.key, position))
+            self.db.executemany(
+                'DELETE FROM members WHERE view = ? AND key = ?',
+                [(view, key) for key in removed])
+            self._mark(view, jql, synced_at)
+
+    def keys(self, view):
+        return set(x[0] for x in self.db.execute(
+            'SELECT key FROM members WHERE view = ?', (view,)))
+
+    def rows(self, view):
+        '''
+        Returns (key, summary, status, assignee, updated) tuples for the
+        issues in a view, in display order.
+        '''
+        return self.db.execute(
+            'SELECT issues.key, summary, status, assignee, updated '
+            'FROM members JOIN issues ON members.key = issues.key '
+            'WHERE view = ? ORDER BY position', (view,)).fetchall()
+
+    def add_documents(self, raws):
+        '''
+        Add (or update) issues, given as the JSON returned by Jira, in the
+        search index.  Only the fields present in each issue are replaced.
+        '''
+        with self.db:
+            for raw in raws:
+                fields = _document_fields(raw)
+                key = fields['key']
+                if 'summary' in fields:
+                    self.db.execute('INSERT OR REPLACE INTO documents '
+                                    '(key, summary) VALUES (?, ?)',
+                                    (key, fields['summary']))
+                else:
+                    self.db.execute('INSERT OR IGNORE INTO documents '
+                                    '(key) VALUES (?)', (key,))
+                for field, text in fields.items():
+                    counts = dict()
+                    for term in tokenize(text):
+                        counts[term] = counts.get(term, 0) + 1
+                    self.db.execute('DELETE FROM postings '
+                                    'WHERE key = ? AND field = ?',
+                                    (key, field))
+                    self.db.executemany(
+                        'INSERT INTO postings (term, key, field, count) '
+                        'VALUES (?, ?, ?, ?)',
+                        [(term, key, field, count)
+                         for term, count in counts.items()])
+
+    def search(self, words, limit=20):
+        '''
+        Rank indexed issues against words.  Issues matching more of the
+        words come first; ties are broken by a TF-IDF score weighted by the
+        field a word was found in.  Returns (key, summary) tuples.
+        '''
+        terms = sorted(set(tokenize(' '.join(words))))
+        if not terms:
+            return []
+        total = self.db.execute('SELECT COUNT(*) FROM documents').fetchone()[0]
+        rows = self.db.execute(
+            'SELECT term, key, field, count FROM postings '
+            'WHERE term IN ({0})'.format(', '.join('?' * len(terms))),
+            terms).fetchall()
+
+        keys_by_term = dict()
+        for term, key, _, _ in rows:
+            keys_by_term.setdefault(term, set()).add(key)
+
+        scores = dict()
+        matched = dict()
+        for term, key, field, count in rows:
+            idf = math.log(1.0 + float(total) / len(keys_by_term[term]))
+            weight = FIELD_WEIGHTS.get(field, 1)
+            scores[key] = scores.get(key, 0.0) + weight * count * idf
+            matched.setdefault(key, set()).add(term)
+
+        ranked = sorted(scores, key=lambda x: (-len(matched[x]), -scores[x],
+                                               x))[:limit]
+        summaries = dict(self.db.execute(
+            'SELECT key, summary FROM documents WHERE key IN ({0})'.format(
+                ', '.join('?' * len(ranked))), ranked).fetchall()) \
+            if ranked else dict()
+        return [(x, summaries.get(x)) for x in ranked]
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+
+# stdlib
+import Queue
+import collections
+import random
+import re
+import threading
+import time
+
+# installed:
+# (requests is imported where it's used since importing it is slow)
+from transport import DEFAULT_CONNECT_TIMEOUT
+from transport import DEFAULT_READ_TIMEOUT
+from transport import make_timeout
+
+
+# only requests that can safely be repeated are retried or hedged:
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# responses that mean the server may well answer a repeated request:
+RETRY_STATUSES = (500, 502, 503, 504)
+
+DEFAULT_RETRIES = 3
+# seconds; retry n (counting from 0) waits a random time of up to
+# backoff * 2 ** n:
+DEFAULT_BACKOFF = 0.2
+MAX_BACKOFF = 10.0
+
+# latencies kept per endpoint for the percentiles:
+SAMPLES = 1000
+
+# parts of URLs that identify one thing rather than an endpoint (issue keys,
+# review ids and numbers other than API versions):
+_IDENTIFIERS = [(re.compile(r'/[A-Z][A-Z0-9_-]*-\d+(?=/|$)'), '/{key}'),
+                (re.compile(r'(?<!/api)/\d+(?=/|$)'), '/{id}')]
+
+
+def endpoint(method, url):
+    '''
+    Returns the name latencies are recorded under for a request, e.g.
+    'GET /rest/api/2/issue/{key}'.
+    '''
+    path = re.sub(r'^[a-z]+://[^/]+', '', url).split('?')[0]
+    for pattern, replacement in _IDENTIFIERS:
+        path = pattern.sub(replacement, path)
+    return '{0} {1}'.format(method.upper(), path)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencyStats(object):
+    '''
+    Latencies (and retries, hedges and errors) of requests by endpoint.
+    '''
+
+    def __init__(self, samples=SAMPLES):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._latencies = dict()
+        self._counts = dict()
+
+    def record(self, name, seconds):
+        with self._lock:
+            if name not in self._latencies:
+                self._latencies[name] = collections.deque(
+                    maxlen=self.samples)
+            self._latencies[name].append(seconds)
+
+    def count(self, name, event):
+        with self._lock:
+            counts = self._counts.setdefault(name, dict())
+            counts[event] = counts.get(event, 0) + 1
+
+    def summary(self):
+        '''
+        Returns a dict of endpoint -> dict of 'count', 'p50', 'p90', 'p99'
+        and 'max' latencies (in seconds) and the number of 'retries',
+        'hedges' and 'errors'.
+        '''
+        with self._lock:
+            names = set(self._latencies) | set(self._counts)
+            summary = dict()
+            for name in names:
+                ordered = sorted(self._latencies.get(name, []))
+                counts = self._counts.get(name, dict())
+                summary[name] = {
+                    'count': len(ordered),
+                    'p50': _percentile(ordered, 0.5) if ordered else None,
+                    'p90': _percentile(ordered, 0.9) if ordered else None,
+                    'p99': _percentile(ordered, 0.99) if ordered else None,
+                    'max': ordered[-1] if ordered else None,
+                    'retries': counts.get('retries', 0),
+                    'hedges': counts.get('hedges', 0),
+                    'errors': counts.get('errors', 0)}
+            return summary
+
+    def report(self):
+        '''
+        Returns the summary as lines of text.
+        '''
+        def seconds(value):
+            return '-' if value is None else '{0:.3f}'.format(value)
+
+        lines = []
+        for name, row in sorted(self.summary().items()):
+            lines.append('{0}: n={1} p50={2} p90={3} p99={4} max={5} '
+                         'retries={6} hedges={7} errors={8}'.format(
+                             name, row['count'], seconds(row['p50']),
+                             seconds(row['p90']), seconds(row['p99']),
+                             seconds(row['max']), row['retries'],
+                             row['hedges'], row['errors']))
+        return lines
+
+
+# shared by every session so that one report covers Jira and Crucible:
+stats = LatencyStats()
+
+
+class ResilientSession(object):
+    '''
+    Wraps a requests session so that every request has a timeout and is
+    timed.  Idempotent requests that fail to connect, time out or get a
+    5xx response are retried after a jittered exponential backoff; with
+    'hedge_after' set, a duplicate is sent if the first attempt hasn't
+    answered within that many seconds and the first answer is used.
+
+    Anything else is passed to the wrapped session.
+    '''
+
+    def __init__(self, session, timeout=None, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, hedge_after=None, stats=stats):
+        self.session = session
+        self.timeout = timeout
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.hedge_after = hedge_after
+        self.stats = stats
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def options(self, url, **kwargs):
+        return self.request('OPTIONS', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def patch(self, url, data=None, **kwargs):
+        return self.request('PATCH', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        from requests.exceptions import ConnectionError
+        from requests.exceptions import Timeout
+
+        method = method.upper()
+        name = endpoint(method, url)
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        idempotent = method in IDEMPOTENT_METHODS
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            if attempt:
+                self.stats.count(name, 'retries')
+                time.sleep(random.uniform(0, min(
+                    MAX_BACKOFF, self.backoff * 2 ** (attempt - 1))))
+            last = attempt == attempts - 1
+            try:
+                if idempotent and self.hedge_after is not None:
+                    response = self._hedged(name, method, url, kwargs)
+                else:
+                    response = self._timed(name, method, url, kwargs)
+            except (ConnectionError, Timeout):
+                self.stats.count(name, 'errors')
+                if last:
+                    raise
+                continue
+            if response.status_code in RETRY_STATUSES:
+                self.stats.count(name, 'errors')
+                if not last:
+                    continue
+            return response
+
+    def _timed(self, name, method, url, kwargs):
+        # the wrapped session's own verb methods are used when it has them
+        # since they may do more than request() (jira's raise JIRAErrors
+        # for 4xx responses, for instance):
+        verb = getattr(self.session, method.lower(), None)
+        started = time.time()
+        try:
+            if verb is None:
+                return self.session.request(method, url, **kwargs)
+            return verb(url, **kwargs)
+        finally:
+            self.stats.record(name, time.time() - started)
+
+    def _hedged(self, name, method, url, kwargs):
+        '''
+        Send a request and, if it hasn't been answered after hedge_after
+        seconds, a duplicate.  Returns the first response (or raises the
+        last error if neither gets one).
+        '''
+        results = Queue.Queue()
+
+        def attempt():
+            try:
+                results.put((True, self._timed(name, method, url, kwargs)))
+            except Exception as e:
+                results.put((False, e))
+
+        def start():
+            thread = threading.Thread(target=attempt)
+            thread.daemon = True
+            thread.start()
+
+        start()
+        pending = 1
+        try:
+            ok, result = results.get(timeout=float(self.hedge_after))
+        except Queue.Empty:
+            self.stats.count(name, 'hedges')
+            start()
+            pending = 2
+            ok, result = results.get()
+        pending -= 1
+        if not ok and pending:
+            # the other attempt may still succeed:
+            ok, result = results.get()
+        if not ok:
+            raise result
+        return result
+
+
+def resilient_session(session, config):
+    '''
+    Wrap a session using the timeouts and retry settings of a config
+    section: 'connect_timeout', 'read_timeout', 'retries', 'backoff' and
+    'hedge_after' (seconds before a duplicate GET is sent; off if not
+    set).
+    '''
+    hedge_after = config.get('hedge_after')
+    return ResilientSession(
+        session,
+        timeout=make_timeout(
+            float(config.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+            float(config.get('read_timeout', DEFAULT_READ_TIMEOUT))),
+        retries=config.get('retries', DEFAULT_RETRIES),
+        backoff=config.get('backoff', DEFAULT_BACKOFF),
+        hedge_after=float(hedge_after) if hedge_after else None)
@@ -7,8 +7,8 @@ import string
 import tempfile
 
 # installed:
-from sh import svn
-from sh import CommandNotFound
+# (sh is imported where it's used since importing it is slow)
+from cache import make_cache
 
 
 class MultipleMatchException(Exception):
@@ -20,18 +20,30 @@ class Subversion(object):
     This class encapsulates interaction with Subversion
     '''
 
-    def __init__(self, config):
+    def __init__(self, config, cache_config=None):
         self.config = config
         self.strippers = ''.join(['/', string.whitespace])
-
-    def get_branches(self):
+        # listing branches is slow and they don't come and go often; the
+        # list is kept with the other caches ('cache_config' is the config
+        # section with their settings, e.g. [jira]):
+        self.branch_cache = make_cache(
+            config if cache_config is None else cache_config, 'branch',
+            ttl=300)
+
+    def get_branches(self, refresh=False):
         '''
         Returns a list of branches in the SVN repo based on the 'branch_url'
-        given in the configuration file.
+        given in the configuration file.  The list is cached for a few
+        minutes unless 'refresh' is given.
         '''
-
-        cmd = svn.ls(self.config['branch_url'])
-        return [x.rstrip(self.strippers) for x in cmd]
+        key = self.config['branch_url']
+        branches = None if refresh else self.branch_cache.get(key)
+        if branches is None:
+            from sh import svn
+            cmd = svn.ls(self.config['branch_url'])
+            branches = [x.rstrip(self.strippers) for x in cmd]
+            self.branch_cache.put(key, branches)
+        return branches
 
     def get_unique_branch(self, search_string):
         '''
@@ -41,17 +53,32 @@ class Subversion(object):
         '''
 
         branches = self.get_branches()
-        branch = [x.rstrip(self.strippers)
-                  for x in branches if search_string in x]
+        branch = [x for x in branches if search_string in x]
+        if not branch:
+            # it may have been made since the branches were cached:
+            branches = self.get_branches(refresh=True)
+            branch = [x for x in branches if search_string in x]
         if len(branch) > 1:
             raise MultipleMatchException('more than one branch matches "{0}"')
 
         return branch[0]
 
+    def log(self, start, end='HEAD'):
+        """
+        Returns the verbose log (messages and changed paths) between two
+        revisions.  The log is taken from 'root_url' if it's configured so
+        that branch paths are included, and from trunk if not.
+        """
+        from sh import svn
+        url = self.config.get('root_url', self.config['trunk_url'])
+        return svn.log(url, r='{0}:{1}'.format(start, end), v=True).stdout
+
     def diff(self, branch):
         """
         Given a branch name, a diff against trunk is produced and returned.
         """
+        from sh import svn
+        from sh import CommandNotFound
         trunk = self.config['trunk_url']
         branch = '/'.join([self.config['branch_url'], branch])
         # if filterdiff exists, pipe diff through it to clean up parts that
@@ -71,6 +98,7 @@ class Subversion(object):
         """
         Reintegration a branch into trunk.
         """
+        from sh import svn
         #TODO: pass commit message as param
 
         trunk_url = self.config['trunk_url']
@@ -94,11 +122,13 @@ class Subversion(object):
         """
         Create a branch.
         """
+        from sh import svn
 
         src = self.config['trunk_url']
         dest = '{0}/{1}'.format(self.config['branch_url'], name)
 
         process = svn.copy(src, dest, m=commit_msg)
+        self.branch_cache.delete(self.config['branch_url'])
         print(process.ran)
         print(process.stdout)
         return process
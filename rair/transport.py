@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# stdlib
+import contextlib
+import re
+import socket
+
+# installed:
+# (requests is imported where it's used since importing it is slow)
+
+
+# connections kept open per host, and the number of hosts pooled:
+DEFAULT_POOL_SIZE = 10
+# seconds to wait for a connection and then for each read of a response:
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 60.0
+
+
+def _requests_version():
+    import requests
+    return tuple(int(x) for x in re.findall(r'\d+', requests.__version__)[:2])
+
+
+def make_session(auth=None, headers=None, pool_size=DEFAULT_POOL_SIZE):
+    '''
+    Returns a requests session that keeps connections alive and reuses
+    them (up to pool_size per host) for every request made through it.
+    '''
+    import requests
+    pool_size = int(pool_size)
+    if _requests_version() < (1, 0):
+        # requests 0.x configures pooling through the session's config:
+        return requests.session(auth=auth, headers=headers or dict(),
+                                config={'keep_alive': True,
+                                        'pool_connections': pool_size,
+                                        'pool_maxsize': pool_size})
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.auth = auth
+    session.headers.update(headers or dict())
+    return session
+
+
+def make_timeout(connect=DEFAULT_CONNECT_TIMEOUT, read=DEFAULT_READ_TIMEOUT):
+    '''
+    Returns the 'timeout' argument for requests made through a session.
+    Versions of requests before 2.4 take a single timeout for the socket,
+    which applies to connecting as well as reading, so the longer (read)
+    one is used there.
+    '''
+    if _requests_version() < (2, 4):
+        return float(max(connect, read))
+    return (float(connect), float(read))
+
+
+def session_settings(config):
+    '''
+    Returns the pool size and timeout configured for a config section
+    ('pool_size', 'connect_timeout' and 'read_timeout').
+    '''
+    return (int(config.get('pool_size', DEFAULT_POOL_SIZE)),
+            make_timeout(float(config.get('connect_timeout',
+                                          DEFAULT_CONNECT_TIMEOUT)),
+                         float(config.get('read_timeout',
+                                          DEFAULT_READ_TIMEOUT))))
+
+
+@contextlib.contextmanager
+def socket_timeout(seconds):
+    '''
+    Give sockets created while the block runs a timeout, for code that
+    makes requests without passing one.
+    '''
+    previous = socket.getdefaulttimeout()
+    socket.setdefaulttimeout(seconds)
+    try:
+        yield
+    finally:
+        socket.setdefaulttimeout(previous)
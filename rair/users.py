@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# stdlib
+from bisect import bisect_left
+
+
+class UserDirectory(object):
+    '''
+    The users that issues in a project can be assigned to.  The full list
+    is paged in from Jira, kept in a DiskCache and answers prefix lookups
+    (e.g. for shell completion) from a sorted index in memory.
+    '''
+
+    PAGE_SIZE = 500
+
+    def __init__(self, jira, cache):
+        self.jira = jira
+        self.cache = cache
+        self._indexes = dict()
+
+    def _cache_key(self, project):
+        return '{0}|{1}'.format(self.jira.config['server'], project)
+
+    def fetch(self, project):
+        '''
+        Page through every assignable user of a project on the server.
+        Returns a sorted list of user names.
+        '''
+        names = set()
+        start = 0
+        while True:
+            page = self.jira.server.search_assignable_users_for_issues(
+                '', project=project, startAt=start, maxResults=self.PAGE_SIZE)
+            # the server may return fewer than we asked for per page, so
+            # only an empty page means we're done:
+            if not page:
+                break
+            names.update([x.name for x in page])
+            start += len(page)
+        return sorted(names)
+
+    def users(self, project, refresh=False):
+        '''
+        Returns the sorted names of the assignable users of a project, from
+        the cache unless it's stale or 'refresh' is given.
+        '''
+        key = self._cache_key(project)
+        names = None if refresh else self.cache.get(key)
+        if names is None:
+            names = self.fetch(project)
+            self.cache.put(key, names)
+            self._indexes.pop(key, None)
+        return names
+
+    def complete(self, project, prefix='', refresh=False):
+        '''
+        Returns the names of the assignable users of a project that start
+        with prefix (ignoring case).
+        '''
+        key = self._cache_key(project)
+        names = self.users(project, refresh=refresh)
+        if key not in self._indexes:
+            self._indexes[key] = sorted([(x.lower(), x) for x in names])
+        index = self._indexes[key]
+
+        prefix = prefix.lower()
+        matches = []
+        for folded, name in index[bisect_left(index, (prefix, '')):]:
+            if not folded.startswith(prefix):
+                break
+            matches.append(name)
+        return matches
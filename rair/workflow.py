@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+# stdlib
+from collections import deque
+
+
+class Workflow(object):
+    '''
+    A Jira workflow graph learned from the transitions the server reports.
+
+    Nodes are statuses and edges are transitions; a graph is kept per
+    project and issue type (which is what determines a Jira workflow) and is
+    stored in a DiskCache so it survives between commands.
+    '''
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._graphs = dict()
+
+    def _graph_key(self, project, kind):
+        return '{0}|{1}'.format(project, kind)
+
+    def graph(self, project, kind):
+        '''
+        Returns the known part of the graph for a project and issue type as
+        a dict of status name -> list of edges.
+        '''
+        key = self._graph_key(project, kind)
+        if key not in self._graphs:
+            self._graphs[key] = self.cache.get(key, None) or dict()
+        return self._graphs[key]
+
+    def transitions(self, project, kind, status):
+        '''
+        Returns the transitions known to leave a status, or None if that
+        status hasn't been seen yet.
+        '''
+        return self.graph(project, kind).get(status)
+
+    def learn(self, project, kind, status, transitions):
+        '''
+        Record the transitions (as returned by the Jira REST API) leaving a
+        status.  Returns the edges recorded.
+        '''
+        edges = [{'id': x['id'], 'name': x['name'],
+                  'to': x['to']['name'] if 'to' in x else None}
+                 for x in transitions]
+        graph = self.graph(project, kind)
+        graph[status] = edges
+        self.cache.put(self._graph_key(project, kind), graph)
+        return edges
+
+    def forget(self, project, kind, status):
+        '''
+        Drop what's known about a status (e.g. after a transition failed).
+        '''
+        graph = self.graph(project, kind)
+        if graph.pop(status, None) is not None:
+            self.cache.put(self._graph_key(project, kind), graph)
+
+    def path(self, project, kind, start, target):
+        '''
+        Find the shortest sequence of transitions from the 'start' status to
+        the 'target' status using only the known graph.  Returns a list of
+        edges (empty if start is the target) or None if no path is known.
+        '''
+        if start == target:
+            return []
+        graph = self.graph(project, kind)
+        previous = {start: None}
+        queue = deque([start])
+        while queue:
+            status = queue.popleft()
+            for edge in graph.get(status) or []:
+                following = edge['to']
+                if following is None or following in previous:
+                    continue
+                previous[following] = (status, edge)
+                if following == target:
+                    path = []
+                    while previous[following] is not None:
+                        following, taken = previous[following]
+                        path.append(taken)
+                    return list(reversed(path))
+                queue.append(following)
+        return None
+
+    def reachable(self, project, kind, start):
+        '''
+        Returns the statuses known to be reachable from the 'start' status
+        (including it), nearest first.
+        '''
+        graph = self.graph(project, kind)
+        found = [start]
+        queue = deque([start])
+        while queue:
+            for edge in graph.get(queue.popleft()) or []:
+                following = edge['to']
+                if following is not None and following not in found:
+                    found.append(following)
+                    queue.append(following)
+        return found
@@ -0,0 +1,113 @@
+# the program we're testing:
+from rair import air
+
+# stdlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from StringIO import StringIO
+
+# installed libraries:
+from configobj import ConfigObj
+
+import unittest2 as unittest
+
+
+class ProbeCommands(air.Commands):
+
+    def probe(self, arger, args, out=sys.stdout):
+        """
+        report whether the issue cache is in use
+        """
+        # long enough for the lines of a batch to overlap:
+        time.sleep(0.1)
+        out.write('{0}\n'.format(self.jira.issue_cache.enabled))
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.config = ConfigObj('./tests/config')
+        self.directory = tempfile.mkdtemp()
+        self.config['jira']['cache_dir'] = self.directory
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.stderr, sys.stderr = sys.stderr, StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _batch(self, text, *options, **kwargs):
+        with open('script', 'w') as script:
+            script.write(text)
+        out = StringIO()
+        dispatcher = air.Dispatcher(self.config, commands=kwargs.get(
+            'commands'))
+        try:
+            dispatcher.go(out=out,
+                          argv=['air', 'batch', 'script'] + list(options))
+            status = 0
+        except SystemExit as e:
+            status = e.code
+        return status, out.getvalue(), dispatcher
+
+    def test_runs_every_line(self):
+        status, output, _ = self._batch(
+            '# set up\n'
+            'air init\n'
+            '\n'
+            '_complete_subcommands  # list them\n')
+        self.assertEqual(0, status)
+        self.assertTrue(os.path.isfile('.airrc'))
+        self.assertIn('init:create a sample .airrc file', output)
+
+    def test_shares_clients(self):
+        _, _, dispatcher = self._batch('init\n')
+        clients = dispatcher.commands._clients
+        self.assertEqual(['jira'], list(clients))
+
+    def test_stops_at_failure(self):
+        status, output, _ = self._batch('no_such_command\ninit\n')
+        self.assertEqual(1, status)
+        self.assertIn('line 1: failed', output)
+        self.assertFalse(os.path.isfile('.airrc'))
+
+    def test_keep_going(self):
+        status, output, _ = self._batch('no_such_command\ninit\n', '-k')
+        self.assertEqual(1, status)
+        self.assertIn('line 1: failed', output)
+        self.assertTrue(os.path.isfile('.airrc'))
+
+    def test_jobs_keep_order(self):
+        status, output, _ = self._batch(
+            '_complete_subcommands\nno_such_command\n_complete_subcommands\n',
+            '--jobs', '3')
+        self.assertEqual(1, status)
+        chunks = output.split('line 2: failed')
+        self.assertEqual(2, len(chunks))
+        self.assertIn('init:', chunks[0])
+        self.assertIn('init:', chunks[1])
+
+    def test_no_cache_per_line(self):
+        commands = ProbeCommands(self.config)
+        status, output, _ = self._batch('probe --no-cache\nprobe\n',
+                                        '--jobs', '2', commands=commands)
+        self.assertEqual(0, status)
+        # bypassing the cache for one line leaves it alone for the other
+        # (and afterwards):
+        self.assertEqual('False\nTrue\n', output)
+        self.assertTrue(commands.jira.issue_cache.enabled)
+
+    def test_no_cache_for_batch(self):
+        _, output, _ = self._batch('probe\nprobe\n', '--jobs', '2',
+                                   '--no-cache',
+                                   commands=ProbeCommands(self.config))
+        self.assertEqual('False\nFalse\n', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+# the program we're testing:
+from rair.bulk import BulkExecutor
+
+# stdlib
+from StringIO import StringIO
+import threading
+
+import unittest2 as unittest
+
+
+class TestBulkExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.out = StringIO()
+        self.executor = BulkExecutor(workers=3, out=self.out)
+
+    def test_run(self):
+        done = []
+        lock = threading.Lock()
+
+        def operation(key):
+            with lock:
+                done.append(key)
+
+        keys = ['MMSANDBOX-{0}'.format(x) for x in range(10)]
+        failures = self.executor.run(keys, operation)
+        self.assertEqual([], failures)
+        self.assertEqual(sorted(keys), sorted(done))
+        self.assertRegexpMatches(self.out.getvalue(), r'\[10/10\]')
+
+    def test_failures(self):
+        def operation(key):
+            if key == 'MMSANDBOX-2':
+                raise ValueError('no such issue')
+
+        failures = self.executor.run(['MMSANDBOX-1', 'MMSANDBOX-2'],
+                                     operation)
+        self.assertEqual(['MMSANDBOX-2'], [x[0] for x in failures])
+        self.assertRegexpMatches(self.out.getvalue(),
+                                 'MMSANDBOX-2: failed: no such issue')
+
+    def test_nothing_to_do(self):
+        self.assertEqual([], self.executor.run([], None))
@@ -0,0 +1,69 @@
+# the program we're testing:
+from rair.cache import DiskCache
+from rair.cache import bypassed
+
+# stdlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import unittest2 as unittest
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = DiskCache(self.directory, ttl=60, max_entries=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _age(self, key, seconds):
+        path = self.cache._path(key)
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_round_trip(self):
+        self.cache.put('MMSANDBOX-1', {'fields': {'updated': 'x'}})
+        actual = self.cache.get('MMSANDBOX-1')
+        self.assertEqual({'fields': {'updated': 'x'}}, actual)
+
+    def test_missing(self):
+        self.assertEqual(None, self.cache.get('MMSANDBOX-2'))
+
+    def test_expired(self):
+        self.cache.put('MMSANDBOX-1', {})
+        self._age('MMSANDBOX-1', 120)
+        self.assertEqual(None, self.cache.get('MMSANDBOX-1'))
+
+    def test_eviction(self):
+        self.cache.put('MMSANDBOX-1', 1)
+        self._age('MMSANDBOX-1', 30)
+        self.cache.put('MMSANDBOX-2', 2)
+        self._age('MMSANDBOX-2', 20)
+        self.cache.put('MMSANDBOX-3', 3)
+        # the least recently used entry is gone:
+        self.assertEqual(None, self.cache.get('MMSANDBOX-1'))
+        self.assertEqual(2, self.cache.get('MMSANDBOX-2'))
+        self.assertEqual(3, self.cache.get('MMSANDBOX-3'))
+
+    def test_disabled(self):
+        self.cache.enabled = False
+        self.cache.put('MMSANDBOX-1', 1)
+        self.assertEqual(None, self.cache.get('MMSANDBOX-1'))
+
+    def test_bypassed(self):
+        self.cache.put('MMSANDBOX-1', 1)
+        seen = []
+        with bypassed([self.cache]):
+            self.assertEqual(None, self.cache.get('MMSANDBOX-1'))
+            # other threads still use the cache:
+            thread = threading.Thread(
+                target=lambda: seen.append(self.cache.get('MMSANDBOX-1')))
+            thread.start()
+            thread.join()
+        self.assertEqual([1], seen)
+        self.assertEqual(1, self.cache.get('MMSANDBOX-1'))
@@ -0,0 +1,98 @@
+# the program we're testing:
+from rair import air
+from rair.cache import DiskCache
+
+# stdlib
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+
+# installed libraries:
+from configobj import ConfigObj
+
+import unittest2 as unittest
+
+
+class TestCompleteAll(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = ConfigObj('./tests/config')
+        self.config['jira']['cache_dir'] = self.directory
+        self.cache = DiskCache(os.path.join(self.directory, 'completion'))
+        self.key = 'https://jira.r.mutualmobile.com|test.user|MMSANDBOX'
+
+        # record how fresh the cached data was when a refresh was started:
+        self.spawned = []
+        self.real_spawn = air._spawn_detached
+        air._spawn_detached = lambda argv: self.spawned.append(
+            (argv, self.cache.age(self.key)))
+
+        # completion data would come from Jira; count how often it's built:
+        self.built = []
+        self.real_data = air.Commands._completion_data
+
+        def completion_data(commands, refresh=False):
+            self.built.append(refresh)
+            return {'ticket': ['MMSANDBOX-{0}:issue'.format(len(self.built))]}
+        air.Commands._completion_data = completion_data
+
+    def tearDown(self):
+        air._spawn_detached = self.real_spawn
+        air.Commands._completion_data = self.real_data
+        shutil.rmtree(self.directory)
+
+    def _complete(self, *args):
+        out = StringIO()
+        air.Dispatcher(self.config).go(out=out,
+                                       argv=['air', '_complete_all'] +
+                                       list(args))
+        return out.getvalue()
+
+    def test_miss(self):
+        self.assertEqual('ticket\tMMSANDBOX-1:issue\n', self._complete())
+        self.assertEqual('ticket\tMMSANDBOX-1:issue\n', self._complete())
+        self.assertEqual([False], self.built)
+        self.assertEqual([], self.spawned)
+
+    def test_stale(self):
+        self._complete()
+        then = time.time() - 700
+        os.utime(self.cache._path(self.key), (then, then))
+        # the stale data is used while a refresh is started in the
+        # background:
+        self.assertEqual('ticket\tMMSANDBOX-1:issue\n', self._complete())
+        self.assertEqual(1, len(self.spawned))
+        argv, age = self.spawned[0]
+        self.assertEqual(['_complete_all', '--refresh'], argv)
+        # the entry was marked fresh before the refresh was started, so
+        # other shells don't start one as well:
+        self.assertLess(age, 600)
+        self._complete()
+        self.assertEqual(1, len(self.spawned))
+
+    def test_per_config(self):
+        self._complete()
+        self.config['jira']['project'] = 'OTHER'
+        self.assertEqual('ticket\tMMSANDBOX-2:issue\n', self._complete())
+        self.assertEqual([False, False], self.built)
+
+    def test_refresh(self):
+        self._complete()
+        self._complete('--refresh')
+        self.assertEqual([False, True], self.built)
+        self.assertEqual('ticket\tMMSANDBOX-2:issue\n', self._complete())
+
+    def test_cache_off(self):
+        self.config['jira']['cache'] = 'off'
+        self._complete()
+        self._complete()
+        self.assertEqual([False, False], self.built)
+        self.assertEqual([], self.spawned)
+        self.assertFalse(os.path.exists(self.cache.directory))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -29,7 +29,8 @@ class TestCrucibleCreateReview(unittest.TestCase):
         self.config['svn']['branch_url'] = self.repo_url + '/branches'
         self.config['svn']['trunk_url'] = self.repo_url + '/trunk'
 
-        self.svn = air.Subversion(self.config['svn'])
+        self.svn = air.Subversion(self.config['svn'],
+                                  cache_config=self.config['jira'])
 
         self.jira = air.Jira(self.config['jira'])
         self.summary = "test bug for Crucible"
@@ -115,7 +116,8 @@ class TestFinishReview(unittest.TestCase):
         self.config['svn']['branch_url'] = self.repo_url + '/branches'
         self.config['svn']['trunk_url'] = self.repo_url + '/trunk'
 
-        self.svn = air.Subversion(self.config['svn'])
+        self.svn = air.Subversion(self.config['svn'],
+                                  cache_config=self.config['jira'])
 
         self.jira = air.Jira(self.config['jira'])
         self.summary = "test bug for Crucible"
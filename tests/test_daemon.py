@@ -0,0 +1,145 @@
+# the program we're testing:
+from rair import air  # noqa (imported before the tests change directory)
+from rair import daemon
+
+# stdlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+
+import unittest2 as unittest
+
+
+class RecordingDaemon(daemon.Daemon):
+    '''
+    Records the commands it's asked to run instead of running them.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        daemon.Daemon.__init__(self, *args, **kwargs)
+        self.ran = []
+
+    def run(self, argv, cwd, env, out, err):
+        self.ran.append(argv)
+        return 0
+
+
+class FakeDispatcher(object):
+
+    def go(self, out, argv):
+        self.environ = dict(os.environ)
+        return 0
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket = os.path.join(self.directory, 'air.sock')
+        os.environ['AIR_SOCKET'] = self.socket
+        shutil.copy('./tests/config', os.path.join(self.directory, '.airrc'))
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        for name in ('AIR_SOCKET', 'AIR_DAEMON_WAIT', 'AIR_NO_DAEMON'):
+            os.environ.pop(name, None)
+        shutil.rmtree(self.directory)
+
+    def _serve(self, requests):
+        server = daemon.Daemon(self.socket, idle_timeout=5)
+        thread = threading.Thread(target=lambda: [server.handle_request()
+                                                  for _ in range(requests)])
+        thread.start()
+        return server, thread
+
+    def _forward(self, *args):
+        out = StringIO()
+        err = StringIO()
+        status = daemon.forward(['air'] + list(args), out=out, err=err)
+        return status, out.getvalue(), err.getvalue()
+
+    def test_no_daemon(self):
+        self.assertIsNone(self._forward('_complete_subcommands')[0])
+
+    def test_forward(self):
+        server, thread = self._serve(1)
+        status, out, _ = self._forward('_complete_subcommands')
+        thread.join()
+        server.server_close()
+        self.assertEqual(0, status)
+        self.assertIn('init:create a sample .airrc file', out)
+        self.assertEqual(self.directory, os.getcwd())
+
+    def test_errors(self):
+        server, thread = self._serve(1)
+        status, _, err = self._forward('no_such_command')
+        thread.join()
+        server.server_close()
+        self.assertEqual(2, status)
+        self.assertIn('invalid choice', err)
+
+    def test_config_reloaded(self):
+        server, thread = self._serve(2)
+        self._forward('_complete_subcommands')
+        first = server.dispatcher(self.directory)
+        # a changed .airrc means a new Dispatcher:
+        os.utime('.airrc', (0, 0))
+        self._forward('_complete_subcommands')
+        thread.join()
+        server.server_close()
+        self.assertIsNot(first, server.dispatcher(self.directory))
+        self.assertEqual(1, len(server.dispatchers))
+
+    def test_stop(self):
+        server, thread = self._serve(1)
+        self.assertTrue(daemon.stop())
+        thread.join()
+        server.server_close()
+        self.assertTrue(server.stopping)
+
+    def test_busy(self):
+        # a daemon that doesn't get to the command in time (here, one that
+        # isn't handling requests yet) leaves it to the client:
+        os.environ['AIR_DAEMON_WAIT'] = '0.1'
+        server = RecordingDaemon(self.socket)
+        started = time.time()
+        self.assertIsNone(self._forward('_complete_subcommands')[0])
+        self.assertLess(time.time() - started, 1)
+        # and doesn't run it once it does get to it:
+        server.handle_request()
+        server.server_close()
+        self.assertEqual([], server.ran)
+
+    def test_background(self):
+        server = RecordingDaemon(self.socket)
+        os.environ['AIR_NO_DAEMON'] = '1'
+        self.assertIsNone(self._forward('_prefetch', 'MMSANDBOX-1')[0])
+        server.server_close()
+
+    def test_environment(self):
+        server = daemon.Daemon(self.socket)
+        dispatcher = FakeDispatcher()
+        server.dispatchers[air.config_stamp(self.directory)] = dispatcher
+        before = dict(os.environ)
+        server.run(['air', 'anything'], self.directory,
+                   {'PATH': '/client/bin', 'DISPLAY': ':1'}, StringIO(),
+                   StringIO())
+        server.server_close()
+        # the command saw the client's environment and only that:
+        self.assertEqual({'PATH': '/client/bin', 'DISPLAY': ':1'},
+                         dispatcher.environ)
+        self.assertEqual(before, dict(os.environ))
+
+    def test_idle(self):
+        server = daemon.Daemon(self.socket, idle_timeout=0.01)
+        server.serve()
+        self.assertFalse(os.path.exists(self.socket))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+# the program we're testing:
+from rair import air
+from rair.atlassian_jira import Jira
+from rair.atlassian_jira import UnknownFilterException
+
+# stdlib
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+
+# installed libraries:
+from configobj import ConfigObj
+
+import unittest2 as unittest
+
+
+class FakeFilter(object):
+
+    def __init__(self, name, jql):
+        self.name = name
+        self.jql = jql
+
+
+class FakeServer(object):
+
+    def __init__(self, filters):
+        self.filters = filters
+        self.calls = 0
+
+    def favourite_filters(self):
+        self.calls += 1
+        return [FakeFilter(x, y) for x, y in sorted(self.filters.items())]
+
+
+class TestFavouriteFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jira = Jira({'server': 'https://jira.example.com',
+                          'username': 'test.user',
+                          'cache_dir': self.directory})
+        self.server = FakeServer({'mine': 'assignee=currentUser()'})
+        self.jira._server = self.server
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _age(self, seconds):
+        # make the cached filters look 'seconds' old:
+        path = self.jira.filter_cache._path('https://jira.example.com|'
+                                            'test.user')
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_cached(self):
+        self.jira.favourite_filters()
+        self.server.filters = dict()
+        self.assertEqual({'mine': 'assignee=currentUser()'},
+                         self.jira.favourite_filters())
+        self.assertEqual(1, self.server.calls)
+
+    def test_expired(self):
+        self.jira.favourite_filters()
+        self._age(25 * 3600)
+        self.server.filters = {'theirs': 'assignee=someone.else'}
+        self.assertEqual(['theirs'], list(self.jira.favourite_filters()))
+        self.assertEqual(2, self.server.calls)
+
+    def test_refresh(self):
+        self.jira.favourite_filters()
+        self.server.filters['new'] = 'status = Open'
+        filters = self.jira.favourite_filters(refresh=True)
+        self.assertEqual(['mine', 'new'], sorted(filters))
+        self.assertEqual(2, self.server.calls)
+
+    def test_filter_jql(self):
+        self.assertEqual('assignee=currentUser()',
+                         self.jira.filter_jql('mine'))
+        self.assertEqual(1, self.server.calls)
+
+    def test_new_filter(self):
+        # a filter missing from the cache causes one refresh:
+        self.jira.favourite_filters()
+        self.server.filters['new'] = 'status = Open'
+        self.assertEqual('status = Open', self.jira.filter_jql('new'))
+        self.assertEqual(2, self.server.calls)
+
+    def test_unknown_filter(self):
+        self.jira.favourite_filters()
+        with self.assertRaises(UnknownFilterException):
+            self.jira.filter_jql('gobbledygook')
+        self.assertEqual(2, self.server.calls)
+
+
+class TestCompleteFilters(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = ConfigObj('./tests/config')
+        self.config['jira']['cache_dir'] = self.directory
+        jira = air.Commands(self.config).jira
+        jira.filter_cache.put('{0}|{1}'.format(
+            self.config['jira']['server'], self.config['jira']['username']),
+            {'ready for review': 'status = "Ready for Review"',
+             'assigned to me': 'assignee=currentUser()'})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_complete_filters(self):
+        out = StringIO()
+        air.Dispatcher(self.config).go(out=out,
+                                       argv=['air', '_complete_filters'])
+        self.assertEqual('assigned to me\nready for review\n',
+                         out.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
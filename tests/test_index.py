@@ -0,0 +1,83 @@
+# the program we're testing:
+from rair.atlassian_jira import IssueRecord
+from rair.index import IssueIndex
+
+# stdlib
+import os
+import shutil
+import tempfile
+
+import unittest2 as unittest
+
+
+class TestIssueIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = IssueIndex(os.path.join(self.directory, 'index.sqlite'))
+        self.jql = 'assignee=currentUser()'
+        self.index.replace('list', self.jql, [
+            IssueRecord('MMSANDBOX-2', summary='second'),
+            IssueRecord('MMSANDBOX-1', summary='first')], 100.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_rows(self):
+        keys = [x[0] for x in self.index.rows('list')]
+        self.assertEqual(['MMSANDBOX-2', 'MMSANDBOX-1'], keys)
+
+    def test_watermark(self):
+        self.assertEqual(100.0, self.index.watermark('list'))
+        self.assertEqual(100.0, self.index.watermark('list', self.jql))
+        # the view was loaded from other JQL:
+        self.assertEqual(None, self.index.watermark('list', 'project = X'))
+        self.assertEqual(None, self.index.watermark('review'))
+
+    def test_update(self):
+        self.index.update('list', self.jql, [
+            IssueRecord('MMSANDBOX-1', summary='first, changed'),
+            IssueRecord('MMSANDBOX-3', summary='third')],
+            ['MMSANDBOX-2'], 200.0)
+        rows = [(x[0], x[1]) for x in self.index.rows('list')]
+        self.assertEqual([('MMSANDBOX-1', 'first, changed'),
+                          ('MMSANDBOX-3', 'third')], rows)
+        self.assertEqual(200.0, self.index.watermark('list'))
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.index = IssueIndex(os.path.join(self.directory, 'index.sqlite'))
+        self.index.add_documents([
+            {'key': 'MMSANDBOX-1',
+             'fields': {'summary': 'add email resource list to Contact',
+                        'description': 'the Contact resource needs a list',
+                        'comment': {'comments': [{'body': 'see email'}]}}},
+            {'key': 'MMSANDBOX-2',
+             'fields': {'summary': 'email is sent twice',
+                        'description': None}},
+            {'key': 'MMSANDBOX-3',
+             'fields': {'summary': 'crash on login'}}])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ranking(self):
+        keys = [x[0] for x in self.index.search(['email', 'resource'])]
+        self.assertEqual(['MMSANDBOX-1', 'MMSANDBOX-2'], keys)
+
+    def test_key(self):
+        results = self.index.search(['mmsandbox-3'])
+        self.assertEqual([('MMSANDBOX-3', 'crash on login')], results)
+
+    def test_partial_update(self):
+        # a search that only fetched the summary keeps the description:
+        self.index.add_documents([{'key': 'MMSANDBOX-1',
+                                   'fields': {'summary': 'renamed'}}])
+        results = self.index.search(['resource'])
+        self.assertEqual([('MMSANDBOX-1', 'renamed')], results)
+
+    def test_no_match(self):
+        self.assertEqual([], self.index.search(['nothing']))
@@ -0,0 +1,161 @@
+# the program we're testing:
+from rair.atlassian_jira import IssueRecord
+from rair.atlassian_jira import Jira
+from rair.atlassian_jira import _jql_since
+from rair.atlassian_jira import _split_order_by
+
+# stdlib
+import shutil
+import tempfile
+
+import unittest2 as unittest
+
+
+class TestIssueRecord(unittest.TestCase):
+
+    def test_from_raw(self):
+        raw = {'key': 'MMSANDBOX-1',
+               'fields': {'summary': 'a summary',
+                          'status': {'name': 'Open', 'id': '1'},
+                          'assignee': None}}
+        record = IssueRecord.from_raw(raw)
+        self.assertEqual('MMSANDBOX-1', record.key)
+        self.assertEqual('a summary', record.summary)
+        self.assertEqual('Open', record.status)
+        self.assertEqual(None, record.assignee)
+        self.assertEqual(None, record.updated)
+
+    def test_compact(self):
+        record = IssueRecord('MMSANDBOX-1')
+        with self.assertRaises(AttributeError):
+            record.description = 'records only hold the fields they list'
+
+
+class TestSplitOrderBy(unittest.TestCase):
+
+    def test_order_by(self):
+        condition, order = _split_order_by(
+            'status = Open ORDER BY priority, updatedDate ASC')
+        self.assertEqual('status = Open', condition)
+        self.assertEqual(' ORDER BY priority, updatedDate ASC', order)
+
+    def test_no_order_by(self):
+        self.assertEqual(('status = Open', ''),
+                         _split_order_by('status = Open'))
+
+    def test_only_order_by(self):
+        self.assertEqual(('', ' ORDER BY key'),
+                         _split_order_by('order by key'))
+
+
+class TestJqlSince(unittest.TestCase):
+
+    def test_rounds_up(self):
+        self.assertEqual('-6m', _jql_since(301))
+        self.assertEqual('-5m', _jql_since(300))
+
+
+class FakeSearchServer(object):
+    '''
+    Answers searches with the issues in 'matching'; a 'key in (...)' search
+    only gets those of its keys that match.
+    '''
+
+    def __init__(self, matching):
+        self.matching = matching
+        self.searches = []
+        self._options = {'server': 'https://jira.example.com'}
+        self._session = None
+
+    def search_issues(self, jql, startAt=0, maxResults=50, fields=None,
+                      validate_query=True, json_result=None):
+        self.searches.append((jql, validate_query))
+        self.fields = fields
+        keys = self.matching
+        if jql.startswith('key in ('):
+            asked = jql[len('key in ('):jql.index(')')].split(', ')
+            keys = [x for x in keys if x in asked]
+        issues = [{'key': x, 'fields': {'summary': x.lower()}}
+                  for x in keys[startAt:startAt + maxResults]]
+        return {'issues': issues, 'total': len(keys),
+                'maxResults': maxResults}
+
+
+class TestIndexedIssues(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jira = Jira({'server': 'https://jira.example.com',
+                          'username': 'test.user',
+                          'cache_dir': self.directory,
+                          'list': {'jql': 'assignee=currentUser()'}})
+        self.server = FakeSearchServer(['MMSANDBOX-1', 'MMSANDBOX-2'])
+        self.jira._server = self.server
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _keys(self, **kwargs):
+        return [x.key for x in self.jira.indexed_issues('list', **kwargs)]
+
+    def test_streamed_load(self):
+        issues = self.jira.indexed_issues('list', stream=True)
+        self.assertEqual('MMSANDBOX-1', next(issues).key)
+        # nothing is stored until the load is complete:
+        view = self.jira._view_id('list')
+        self.assertEqual(None, self.jira.index.watermark(view))
+        self.assertEqual(['MMSANDBOX-2'], [x.key for x in issues])
+        self.assertNotEqual(None, self.jira.index.watermark(view))
+
+    def test_cached(self):
+        self._keys()
+        self.server.matching = []
+        self.assertEqual(['MMSANDBOX-1', 'MMSANDBOX-2'], self._keys())
+        self.assertEqual(1, len(self.server.searches))
+
+    def test_jql_changed(self):
+        self._keys()
+        self.jira.config['list']['jql'] = 'assignee=someone.else'
+        self.server.matching = ['MMSANDBOX-3']
+        self.assertEqual(['MMSANDBOX-3'], self._keys())
+
+    def test_sync(self):
+        self._keys()
+        self.server.matching = ['MMSANDBOX-2', 'MMSANDBOX-3']
+        self.assertEqual(['MMSANDBOX-2', 'MMSANDBOX-3'],
+                         self._keys(sync=True))
+        changed, left = self.server.searches[1:]
+        # the five minute margin plus the moments since the first load:
+        self.assertEqual(('(assignee=currentUser()) AND updated >= "-6m"',
+                          True), changed)
+        # only the issues already in the view are checked, and a deleted
+        # one mustn't make Jira reject the search:
+        self.assertEqual(('key in (MMSANDBOX-1, MMSANDBOX-2) AND '
+                          '(assignee=currentUser())', False), left)
+
+
+class TestGetIssues(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jira = Jira({'server': 'https://jira.example.com',
+                          'username': 'test.user',
+                          'cache_dir': self.directory})
+        self.server = FakeSearchServer(['MMSANDBOX-1', 'MMSANDBOX-2'])
+        self.jira._server = self.server
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_one_search(self):
+        issues = self.jira.get_issues(['MMSANDBOX-2', 'UTF-8', 'mmsandbox-1'])
+        self.assertEqual(['MMSANDBOX-2', 'MMSANDBOX-1'],
+                         [x.key for x in issues])
+        # words that look like keys mustn't make Jira reject the search:
+        self.assertEqual([('key in (MMSANDBOX-2, UTF-8, MMSANDBOX-1)',
+                           False)], self.server.searches)
+
+    def test_cached_in_full(self):
+        self.jira.get_issues(['MMSANDBOX-1'])
+        self.assertEqual('*all', self.server.fields)
+        self.assertNotEqual(None, self.jira.issue_cache.get('MMSANDBOX-1'))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# the program we're testing:
+from rair import crucible
+from rair.crucible import Crucible
+from rair.crucible import Review
+
+# stdlib
+import BaseHTTPServer
+import gzip
+import json
+import threading
+from StringIO import StringIO
+
+import unittest2 as unittest
+
+
+PATCH = ''.join(['+line {0} "quoted" \\ \t café\n'.format(x)
+                 for x in range(5000)])
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        encoding = self.headers.get('Content-Encoding')
+        self.server.uploads.append((self.path, self.headers.get(
+            'Content-Type'), encoding, body))
+        if encoding and not self.server.gzip:
+            self.send_response(415)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        reply = json.dumps({'path': self.path})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAddPatch(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.uploads = []
+        self.server.gzip = True
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.config = {
+            'username': 'first.last', 'password': 'secret', 'key': 'CR',
+            'server': 'http://127.0.0.1:{0}'.format(self.server.server_port)}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _add_patch(self, **options):
+        self.config.update(options)
+        review = Review(Crucible(self.config), 'CR-1')
+        return review.add_patch(PATCH)
+
+    def test_json(self):
+        self._add_patch()
+        path, _, encoding, body = self.server.uploads[0]
+        self.assertEqual('/rest-service/reviews-v1/CR-1/patch', path)
+        self.assertIsNone(encoding)
+        self.assertEqual(PATCH.decode('utf-8'), json.loads(body)['patch'])
+
+    def test_gzip(self):
+        self._add_patch(gzip_uploads='on')
+        _, _, encoding, body = self.server.uploads[0]
+        self.assertEqual('gzip', encoding)
+        self.assertLess(len(body), len(PATCH) / 10)
+        text = gzip.GzipFile(fileobj=StringIO(body)).read()
+        self.assertEqual(PATCH.decode('utf-8'), json.loads(text)['patch'])
+
+    def test_gzip_refused(self):
+        self.server.gzip = False
+        self._add_patch(gzip_uploads='on')
+        self.assertEqual(['gzip', None],
+                         [x[2] for x in self.server.uploads])
+
+    def test_large(self):
+        self._add_patch(patch_upload_limit=str(len(PATCH) - 1))
+        path, content_type, _, body = self.server.uploads[0]
+        self.assertEqual('/rest-service/reviews-v1/CR-1/addFile', path)
+        self.assertTrue(content_type.startswith('multipart/form-data'))
+        self.assertIn('filename="CR-1.patch"', body)
+        self.assertIn(PATCH, body)
+
+
+class TestChunks(unittest.TestCase):
+
+    def test_whole_lines(self):
+        chunks = list(crucible._chunks(PATCH, size=100))
+        self.assertEqual(PATCH, ''.join(chunks))
+        self.assertTrue(all(x.endswith('\n') for x in chunks))
+
+    def test_no_newline(self):
+        self.assertEqual(['abc'], list(crucible._chunks('abc', size=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# the program we're testing:
+from rair import air
+from rair.atlassian_jira import IssueRecord
+from rair.subversion import Subversion
+
+# stdlib
+import os
+import shutil
+import tempfile
+import time
+from StringIO import StringIO
+
+# installed libraries:
+from configobj import ConfigObj
+
+import unittest2 as unittest
+
+
+class TestPrefetch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = ConfigObj('./tests/config')
+        self.config['jira']['cache_dir'] = self.directory
+        self.spawned = []
+        self.real_spawn = air._spawn_detached
+        air._spawn_detached = self.spawned.append
+
+        jira = air.Commands(self.config).jira
+        records = [IssueRecord('MMSANDBOX-{0}'.format(x), 'issue', 'Open',
+                               'first.last', None) for x in range(5)]
+        jira.index.replace(jira._view_id('list'),
+                           jira._configured_jql('list'), records, time.time())
+
+    def tearDown(self):
+        air._spawn_detached = self.real_spawn
+        shutil.rmtree(self.directory)
+
+    def _list(self, *args):
+        out = StringIO()
+        air.Dispatcher(self.config).go(out=out,
+                                       argv=['air', 'list_tickets'] +
+                                       list(args))
+        return out.getvalue()
+
+    def test_off_by_default(self):
+        output = self._list()
+        self.assertIn('MMSANDBOX-4', output)
+        self.assertEqual([], self.spawned)
+
+    def test_prefetch(self):
+        self._list('--prefetch', '2')
+        self.assertEqual([['_prefetch', 'MMSANDBOX-0', 'MMSANDBOX-1']],
+                         self.spawned)
+
+    def test_configured(self):
+        self.config['jira']['prefetch'] = '3'
+        self._list()
+        self.assertEqual(4, len(self.spawned[0]))
+
+    def test_no_cache(self):
+        self._list('--prefetch', '2', '--no-cache')
+        self.assertEqual([], self.spawned)
+
+
+class TestBranchCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.svn = Subversion({'branch_url': 'file:///nowhere/branches',
+                               'cache_dir': self.directory})
+        self.svn.branch_cache.put('file:///nowhere/branches',
+                                  ['ABC-1_first', 'ABC-2_second'])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached(self):
+        self.assertEqual('ABC-2_second', self.svn.get_unique_branch('ABC-2'))
+
+    def test_jira_settings(self):
+        # the branch list is kept with the other caches and follows their
+        # settings:
+        config = ConfigObj('./tests/config')
+        config['jira']['cache_dir'] = self.directory
+        commands = air.Commands(config)
+        self.assertEqual(os.path.join(self.directory, 'branch'),
+                         commands.svn.branch_cache.directory)
+        self.assertIn(commands.svn.branch_cache, commands._caches())
+
+        config['jira']['cache'] = 'off'
+        self.assertFalse(air.Commands(config).svn.branch_cache.enabled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# the program we're testing:
+from rair import air
+
+# stdlib
+import os
+import shutil
+import sys
+import tempfile
+from StringIO import StringIO
+
+# installed libraries:
+from configobj import ConfigObj
+
+import unittest2 as unittest
+
+
+class TestCommandRegistry(unittest.TestCase):
+
+    def test_commands(self):
+        registry = air.command_registry()
+        self.assertEqual('create a sample .airrc file', registry['init'])
+        self.assertIn('list_tickets', registry)
+        self.assertIn('_complete_tickets', registry)
+
+    def test_helpers_excluded(self):
+        registry = air.command_registry()
+        for name in ('__init__', '_client', '_subcommands',
+                     '_completion_data', 'jira'):
+            self.assertNotIn(name, registry)
+
+    def test_built_once(self):
+        self.assertIs(air.command_registry(), air.command_registry())
+
+
+class TestDispatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.config = ConfigObj('./tests/config')
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def test_invalid_alias(self):
+        self.config['aliases']['oops'] = 'no_such_command'
+        with self.assertRaises(air.InvalidAliasException):
+            air.Dispatcher(self.config)
+
+    def test_alias(self):
+        self.config['aliases']['setup'] = 'init'
+        out = StringIO()
+        actual = air.Dispatcher(self.config).go(out=out,
+                                                argv=['bogus', 'setup'])
+        self.assertEqual(0, actual)
+        self.assertTrue(os.path.isfile('.airrc'))
+
+    def test_unknown_command(self):
+        sys.stderr, stderr = StringIO(), sys.stderr
+        try:
+            with self.assertRaises(SystemExit):
+                air.Dispatcher(self.config).go(argv=['bogus', 'nope'])
+        finally:
+            sys.stderr = stderr
+
+    def test_names(self):
+        names = air.Dispatcher(self.config).names()
+        self.assertIn('ls', names)
+        self.assertIn('init', names)
+        self.assertNotIn('_client', names)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,244 @@
+# the program we're testing:
+from rair import resilience
+from rair.atlassian_jira import Jira
+from rair.resilience import LatencyStats
+from rair.resilience import ResilientSession
+from rair.transport import make_timeout
+
+# stdlib
+import socket
+import threading
+import time
+
+# installed libraries:
+# (unittest2 first: the six vendored by old versions of requests confuses
+# it otherwise)
+import unittest2 as unittest
+
+import jira.client
+from requests.exceptions import ConnectionError
+from requests.exceptions import Timeout
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, name=None):
+        self.status_code = status_code
+        self.name = name
+
+
+class FakeSession(object):
+    '''
+    Plays back a script of responses (or exceptions, or (delay, response)
+    pairs) and records the requests made.
+    '''
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.requests = []
+        self.headers = {'Accept': 'application/json'}
+
+    def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs.get('timeout')))
+        result = self.script.pop(0)
+        if isinstance(result, tuple):
+            time.sleep(result[0])
+            result = result[1]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class ErrorResponse(Exception):
+    pass
+
+
+class FakeJiraSession(FakeSession):
+    '''
+    Like jira's own session: its verb methods raise for 4xx responses.
+    '''
+
+    def _verb(self, method, url, **kwargs):
+        response = self.request(method, url, **kwargs)
+        if 400 <= response.status_code < 500:
+            raise ErrorResponse(response.status_code)
+        return response
+
+    def get(self, url, **kwargs):
+        return self._verb('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._verb('POST', url, **kwargs)
+
+
+class TestResilientSession(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = LatencyStats()
+
+    def _session(self, fake, **options):
+        options.setdefault('backoff', 0)
+        return ResilientSession(fake, timeout=7, stats=self.stats, **options)
+
+    def test_timeout(self):
+        fake = FakeSession(FakeResponse(200))
+        self._session(fake).get('https://jira.example.com/rest/api/2/x')
+        self.assertEqual(7, fake.requests[0][2])
+
+    def test_retries_get(self):
+        fake = FakeSession(Timeout(), FakeResponse(503), FakeResponse(200))
+        response = self._session(fake).get('https://jira.example.com/a')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(3, len(fake.requests))
+        self.assertEqual(2, self.stats.summary()['GET /a']['retries'])
+
+    def test_gives_up(self):
+        fake = FakeSession(ConnectionError(), ConnectionError())
+        with self.assertRaises(ConnectionError):
+            self._session(fake, retries=1).get('https://jira.example.com/a')
+
+    def test_last_response_returned(self):
+        fake = FakeSession(FakeResponse(503), FakeResponse(502))
+        response = self._session(fake, retries=1).get(
+            'https://jira.example.com/a')
+        self.assertEqual(502, response.status_code)
+
+    def test_post_not_retried(self):
+        fake = FakeSession(Timeout())
+        with self.assertRaises(Timeout):
+            self._session(fake).post('https://jira.example.com/a', data='{}')
+        self.assertEqual(1, len(fake.requests))
+
+    def test_hedged(self):
+        fake = FakeSession((0.5, FakeResponse(200, 'slow')),
+                           FakeResponse(200, 'fast'))
+        started = time.time()
+        response = self._session(fake, hedge_after=0.05).get(
+            'https://jira.example.com/a')
+        self.assertEqual('fast', response.name)
+        self.assertLess(time.time() - started, 0.4)
+        self.assertEqual(1, self.stats.summary()['GET /a']['hedges'])
+
+    def test_not_hedged_when_quick(self):
+        fake = FakeSession(FakeResponse(200))
+        self._session(fake, hedge_after=1).get('https://jira.example.com/a')
+        self.assertEqual(1, len(fake.requests))
+
+    def test_verb_methods_used(self):
+        fake = FakeJiraSession(FakeResponse(404), FakeResponse(400))
+        session = self._session(fake)
+        with self.assertRaises(ErrorResponse):
+            session.get('https://jira.example.com/rest/api/2/issue/X-1')
+        with self.assertRaises(ErrorResponse):
+            session.request('POST', 'https://jira.example.com/a', data='{}')
+        # not retried:
+        self.assertEqual(['GET', 'POST'], [x[0] for x in fake.requests])
+        self.assertEqual(7, fake.requests[0][2])
+
+    def test_passes_through(self):
+        fake = FakeSession()
+        self.assertIs(fake.headers, self._session(fake).headers)
+
+
+class TestLatencyStats(unittest.TestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(
+            'GET /rest/api/2/issue/{key}/transitions',
+            resilience.endpoint('get', 'https://jira.example.com/rest/api/2/'
+                                'issue/ABC-12/transitions?expand=x'))
+        self.assertEqual(
+            'DELETE /rest-service/reviews-v1/{key}/reviewers/first.last',
+            resilience.endpoint('DELETE', 'https://fisheye.example.com/'
+                                'rest-service/reviews-v1/CR-MMSANDBOX-7/'
+                                'reviewers/first.last'))
+        self.assertEqual('GET /rest/api/2/filter/{id}',
+                         resilience.endpoint('GET', '/rest/api/2/filter/1234'))
+
+    def test_percentiles(self):
+        stats = LatencyStats()
+        for x in range(1, 101):
+            stats.record('GET /a', x / 100.0)
+        row = stats.summary()['GET /a']
+        self.assertEqual(100, row['count'])
+        self.assertEqual(0.51, row['p50'])
+        self.assertEqual(1.0, row['p99'])
+        self.assertEqual(1.0, row['max'])
+        self.assertIn('GET /a: n=100 p50=0.510', stats.report()[0])
+
+    def test_bounded(self):
+        stats = LatencyStats(samples=10)
+        for x in range(100):
+            stats.record('GET /a', x)
+        self.assertEqual(10, stats.summary()['GET /a']['count'])
+
+
+
+class FakeJIRA(object):
+    '''
+    Records the timeouts a client logging in would have used.
+    '''
+
+    made = []
+
+    def __init__(self, options, basic_auth=None, timeout=None):
+        FakeJIRA.made.append((timeout, socket.getdefaulttimeout()))
+        self._session = FakeSession()
+
+
+class OldFakeJIRA(FakeJIRA):
+    '''
+    A client from before JIRA() took a timeout.
+    '''
+
+    def __init__(self, options, basic_auth=None):
+        FakeJIRA.__init__(self, options, basic_auth)
+
+
+class SlowFakeJIRA(FakeJIRA):
+
+    def __init__(self, options, basic_auth=None, timeout=None):
+        time.sleep(0.1)
+        FakeJIRA.__init__(self, options, basic_auth, timeout)
+
+
+class TestJiraLogin(unittest.TestCase):
+
+    def setUp(self):
+        self.real_jira = jira.client.JIRA
+        FakeJIRA.made = []
+        self.jira = Jira({'server': 'https://jira.example.com',
+                          'username': 'test.user', 'password': 'secret',
+                          'connect_timeout': '2', 'read_timeout': '9'})
+
+    def tearDown(self):
+        jira.client.JIRA = self.real_jira
+
+    def test_timeout(self):
+        jira.client.JIRA = FakeJIRA
+        self.assertIsInstance(self.jira.server._session, ResilientSession)
+        self.assertEqual([(make_timeout(2, 9), 9)], FakeJIRA.made)
+        # the default is only changed while logging in:
+        self.assertEqual(None, socket.getdefaulttimeout())
+
+    def test_old_client(self):
+        jira.client.JIRA = OldFakeJIRA
+        self.jira.server
+        self.assertEqual([(None, 9)], FakeJIRA.made)
+
+    def test_logs_in_once(self):
+        jira.client.JIRA = SlowFakeJIRA
+        servers = []
+        threads = [threading.Thread(
+            target=lambda: servers.append(self.jira.server))
+            for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(1, len(FakeJIRA.made))
+        self.assertEqual(1, len(set(id(x) for x in servers)))
+
+
+if __name__ == '__main__':
+    unittest.main()
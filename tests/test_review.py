@@ -0,0 +1,99 @@
+# the program we're testing:
+from rair.crucible import Crucible
+from rair.crucible import Review
+
+# stdlib
+import BaseHTTPServer
+import json
+import threading
+
+import unittest2 as unittest
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Serves the details of one review, with an ETag that changes when the
+    review does.
+    '''
+
+    def _reply(self, status, data=None, etag=None):
+        body = json.dumps(data) if data is not None else ''
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.requests.append(('GET', self.path,
+                                     self.headers.get('If-None-Match')))
+        etag = '"{0}"'.format(self.server.version)
+        if self.path.endswith('/reviewsForIssue?jiraKey=ABC-1'):
+            self._reply(200, {'reviewData': [{'permaId': {'id': 'CR-1'}}]})
+        elif self.headers.get('If-None-Match') == etag:
+            self._reply(304)
+        else:
+            self._reply(200, {'state': self.server.state, 'reviewers': {
+                'reviewer': [{'userName': 'first.reviewer'}]}}, etag)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append(('POST', self.path, None))
+        self.server.state = 'Review'
+        self.server.version += 1
+        self._reply(200)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestReview(unittest.TestCase):
+
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.requests = []
+        self.server.state = 'Draft'
+        self.server.version = 1
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.crucible = Crucible({
+            'username': 'first.last', 'password': 'secret', 'key': 'CR',
+            'server': 'http://127.0.0.1:{0}'.format(self.server.server_port)})
+        self.review = self.crucible.review('CR-1')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_one_fetch(self):
+        self.assertEqual('Draft', self.review.state)
+        self.assertEqual(['first.reviewer'], self.review.reviewers)
+        self.assertEqual('Draft', self.crucible.get_review('CR-1')['state'])
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_revalidate(self):
+        self.review.details
+        self.review.MAX_AGE = -1
+        self.assertEqual('Draft', self.review.state)
+        self.assertEqual(('GET', '/rest-service/reviews-v1/CR-1/details',
+                          '"1"'), self.server.requests[-1])
+
+    def test_invalidated_by_transition(self):
+        self.assertEqual('Draft', self.review.state)
+        self.review.start()
+        self.assertEqual('Review', self.review.state)
+        self.assertIsNone(self.server.requests[-1][2])
+
+    def test_get(self):
+        self.assertEqual('Draft', self.review.get().data['state'])
+
+    def test_same_review(self):
+        review = self.crucible.get_review_from_issue('ABC-1')
+        self.assertIs(self.review, review)
+        self.assertIsInstance(review, Review)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# the program we're testing:
+from rair.crucible import Crucible
+from rair.crucible import Review
+
+import unittest2 as unittest
+
+
+class FakeCrucible(object):
+    '''
+    Answers requests about a review's reviewers and records every request.
+    '''
+
+    def __init__(self, reviewers):
+        self.uri_api_base = 'https://fisheye.example.com/rest-service'
+        self.user_name = 'the.creator'
+        self.pool_size = 4
+        self.reviewers = reviewers
+        self.requests = []
+
+    def _setup_auth_n_headers(self):
+        return None, {'Content-Type': 'application/json'}
+
+    def _send_request(self, method, url, auth=None, params=None,
+                      headers=None, data=None, expected_status_code=200,
+                      body=None):
+        self.requests.append((method.upper(), url.split('/reviews-v1/')[1],
+                              body))
+        return None
+
+    def _conditional_get(self, url, etag=None):
+        self.requests.append(('GET', url.split('/reviews-v1/')[1], None))
+        return {'state': 'Draft', 'reviewers': {'reviewer': [
+            {'userName': x} for x in self.reviewers]}}, None
+
+
+class TestReconcileReviewers(unittest.TestCase):
+
+    def setUp(self):
+        self.crucible = FakeCrucible(['auto.one', 'auto.two', 'wanted.one',
+                                      'ghost'])
+        self.review = Review(self.crucible, 'CR-1')
+
+    def test_reconcile(self):
+        added, removed = self.review.reconcile_reviewers(
+            ['wanted.one', 'wanted.two', 'the.creator'], ignore=['ghost'])
+        self.assertEqual(['wanted.two'], added)
+        self.assertEqual(['auto.one', 'auto.two'], removed)
+
+        requests = self.crucible.requests
+        self.assertEqual(('GET', 'CR-1/details', None), requests[0])
+        self.assertEqual(('POST', 'CR-1/reviewers', 'wanted.two'),
+                         requests[1])
+        self.assertEqual([('DELETE', 'CR-1/reviewers/auto.one', None),
+                          ('DELETE', 'CR-1/reviewers/auto.two', None)],
+                         sorted(requests[2:]))
+
+    def test_nothing_to_do(self):
+        self.crucible.reviewers = ['wanted.one']
+        self.assertEqual(([], []),
+                         self.review.reconcile_reviewers(['wanted.one']))
+        self.assertEqual(1, len(self.crucible.requests))
+
+
+class TestIgnoreReviewers(unittest.TestCase):
+
+    def _crucible(self, **options):
+        config = {'username': 'first.last', 'password': 'secret',
+                  'key': 'CR', 'server': 'https://fisheye.example.com'}
+        config.update(options)
+        return Crucible(config)
+
+    def test_default(self):
+        self.assertEqual([], self._crucible().ignore_reviewers)
+
+    def test_one(self):
+        self.assertEqual(['ghost'],
+                         self._crucible(
+                             ignore_reviewers='ghost').ignore_reviewers)
+
+    def test_several(self):
+        self.assertEqual(['a', 'b'],
+                         self._crucible(
+                             ignore_reviewers=['a', 'b']).ignore_reviewers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+# the program we're testing:
+from rair import air
+
+# stdlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from StringIO import StringIO
+
+# installed libraries:
+from configobj import ConfigObj
+
+import unittest2 as unittest
+
+
+# commands that only work with local files must finish quickly; the budgets
+# are generous so that only gross slowdowns (e.g. waiting on a connection
+# timeout) fail on a loaded machine:
+LOCAL_COMMAND_BUDGET = 5.0
+
+# 'air' is run on every shell completion, so importing it must be quick and
+# must not import these (slow) libraries; they're imported where they're
+# used:
+IMPORT_BUDGET = 3.0
+HEAVY_MODULES = ('jira', 'requests', 'sh', 'webbrowser', 'multiprocessing')
+
+IMPORT_SCRIPT = '''
+import sys, time
+started = time.time()
+from rair import air
+print(time.time() - started)
+print(' '.join(sorted(set(x.split('.')[0] for x in sys.modules
+                          if x.split('.')[0] in {0!r}))))
+'''.format(HEAVY_MODULES)
+
+
+class TestLocalCommands(unittest.TestCase):
+    '''
+    Commands that don't need Jira, Crucible or Subversion must not make
+    any network connections (e.g. to log in to Jira).
+    '''
+
+    def setUp(self):
+        self.config = ConfigObj('./tests/config')
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.connections = []
+        self.real_connect = socket.socket.connect
+
+        def connect(sock, address):
+            self.connections.append(address)
+            raise socket.error('no network connections allowed')
+
+        socket.socket.connect = connect
+
+    def tearDown(self):
+        socket.socket.connect = self.real_connect
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def _run(self, *args):
+        sys.argv = ['bogus'] + list(args)
+        out = StringIO()
+        started = time.time()
+        actual = air.Dispatcher(self.config).go(out=out)
+        elapsed = time.time() - started
+        self.assertEqual(0, actual)
+        self.assertEqual([], self.connections)
+        self.assertLess(elapsed, LOCAL_COMMAND_BUDGET)
+        return out.getvalue()
+
+    def test_init(self):
+        self._run('init')
+        self.assertTrue(os.path.isfile('.airrc'))
+
+    def test_complete_subcommands(self):
+        output = self._run('_complete_subcommands')
+        self.assertIn('init:create a sample .airrc file', output)
+
+    def test_help(self):
+        sys.stdout, stdout = StringIO(), sys.stdout
+        try:
+            with self.assertRaises(SystemExit):
+                self._run('--help')
+        finally:
+            sys.stdout = stdout
+        self.assertEqual([], self.connections)
+
+
+class TestImportTime(unittest.TestCase):
+
+    def _import(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        process = subprocess.Popen(
+            [sys.executable, '-c', IMPORT_SCRIPT],
+            cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        self.assertEqual(0, process.returncode, stderr)
+        elapsed, heavy = (stdout.decode().split('\n') + [''])[:2]
+        return float(elapsed), heavy.split()
+
+    def test_no_heavy_imports(self):
+        # import once to make sure byte code is compiled:
+        self._import()
+        elapsed, heavy = self._import()
+        self.assertEqual([], heavy)
+        self.assertLess(elapsed, IMPORT_BUDGET)
@@ -0,0 +1,98 @@
+# the program we're testing:
+from rair import transport
+from rair.crucible import Crucible
+
+# stdlib
+import BaseHTTPServer
+import json
+import SocketServer
+import threading
+
+import unittest2 as unittest
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep connections open between requests:
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        # Crucible sends a (JSON) body even with GETs:
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests.append(self.path)
+        body = json.dumps({'path': self.path})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    # a kept-alive connection mustn't hold up shutting the server down:
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.requests = []
+        self.connections = 0
+
+    def get_request(self):
+        self.connections += 1
+        return BaseHTTPServer.HTTPServer.get_request(self)
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.crucible = Crucible({
+            'username': 'first.last', 'password': 'secret', 'key': 'CR',
+            'server': 'http://127.0.0.1:{0}'.format(self.server.server_port),
+            'pool_size': '2', 'connect_timeout': '1', 'read_timeout': '3'})
+
+    def tearDown(self):
+        self.crucible.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        for name in ('a', 'b', 'c'):
+            data = self.crucible._send_request(
+                'GET', self.crucible.uri_api_base + '/' + name)
+            self.assertEqual('/rest-service/' + name, data['path'])
+        self.assertEqual(3, len(self.server.requests))
+        self.assertEqual(1, self.server.connections)
+
+    def test_one_session(self):
+        self.assertIs(self.crucible.session, self.crucible.session)
+        self.assertIs(self.crucible._setup_auth_n_headers(),
+                      self.crucible._setup_auth_n_headers())
+
+    def test_timeout(self):
+        self.crucible.session
+        self.assertEqual(transport.make_timeout(1, 3), self.crucible.timeout)
+
+
+class TestTimeout(unittest.TestCase):
+
+    def test_timeout(self):
+        timeout = transport.make_timeout(2, 30)
+        if transport._requests_version() < (2, 4):
+            self.assertEqual(30.0, timeout)
+        else:
+            self.assertEqual((2.0, 30.0), timeout)
+
+    def test_defaults(self):
+        pool_size, timeout = transport.session_settings({})
+        self.assertEqual(transport.DEFAULT_POOL_SIZE, pool_size)
+        self.assertEqual(transport.make_timeout(), timeout)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# the program we're testing:
+from rair.cache import DiskCache
+from rair.users import UserDirectory
+
+# stdlib
+import shutil
+import tempfile
+
+import unittest2 as unittest
+
+
+class FakeUser(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeServer(object):
+    '''
+    Pages through users like Jira does, never returning more than 'cap' at
+    a time.
+    '''
+
+    def __init__(self, names, cap):
+        self.names = names
+        self.cap = cap
+        self.calls = 0
+
+    def search_assignable_users_for_issues(self, username, project=None,
+                                           startAt=0, maxResults=50):
+        self.calls += 1
+        size = min(maxResults, self.cap)
+        return [FakeUser(x) for x in self.names[startAt:startAt + size]]
+
+
+class FakeJira(object):
+
+    def __init__(self, server):
+        self.config = {'server': 'https://jira.example.com'}
+        self.server = server
+
+
+class TestUserDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        names = ['user.{0:03d}'.format(x) for x in range(250)]
+        names += ['jon.oelfke', 'Ethan.Sherman', 'ethan.smith']
+        self.server = FakeServer(names, cap=100)
+        self.users = UserDirectory(FakeJira(self.server),
+                                   DiskCache(self.directory, ttl=60))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_all_pages(self):
+        self.assertEqual(253, len(self.users.users('MMSANDBOX')))
+
+    def test_prefix(self):
+        self.assertEqual(['Ethan.Sherman', 'ethan.smith'],
+                         self.users.complete('MMSANDBOX', 'eth'))
+        self.assertEqual(['jon.oelfke'],
+                         self.users.complete('MMSANDBOX', 'jon'))
+        self.assertEqual([], self.users.complete('MMSANDBOX', 'zed'))
+
+    def test_cached(self):
+        self.users.users('MMSANDBOX')
+        calls = self.server.calls
+        other = UserDirectory(self.users.jira, self.users.cache)
+        self.assertEqual(['jon.oelfke'], other.complete('MMSANDBOX', 'j'))
+        self.assertEqual(calls, self.server.calls)
@@ -0,0 +1,239 @@
+# the program we're testing:
+from rair.atlassian_jira import InvalidJiraStatusException
+from rair.atlassian_jira import Jira
+from rair.cache import DiskCache
+from rair.workflow import Workflow
+
+# stdlib
+import shutil
+import tempfile
+
+import unittest2 as unittest
+
+
+def _transition(_id, name, to):
+    return {'id': _id, 'name': name, 'to': {'name': to}}
+
+
+class TestWorkflowPath(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.workflow = Workflow(DiskCache(self.directory))
+        learn = self.workflow.learn
+        learn('MMSANDBOX', 'Bug', 'Open', [
+            _transition('4', 'Start Progress', 'In Progress'),
+            _transition('5', 'Resolve Issue', 'Resolved')])
+        learn('MMSANDBOX', 'Bug', 'In Progress', [
+            _transition('301', 'Stop Progress', 'Open'),
+            _transition('711', 'Ready for Review', 'Ready for Review')])
+        learn('MMSANDBOX', 'Bug', 'Ready for Review', [
+            _transition('721', 'In Review', 'In Review')])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_shortest_path(self):
+        path = self.workflow.path('MMSANDBOX', 'Bug', 'In Progress',
+                                  'Resolved')
+        self.assertEqual(['Stop Progress', 'Resolve Issue'],
+                         [x['name'] for x in path])
+
+    def test_same_status(self):
+        self.assertEqual([], self.workflow.path('MMSANDBOX', 'Bug', 'Open',
+                                                'Open'))
+
+    def test_unknown_path(self):
+        self.assertEqual(None, self.workflow.path('MMSANDBOX', 'Bug',
+                                                  'In Review', 'Open'))
+        self.assertEqual(None, self.workflow.path('MMSANDBOX', 'Task',
+                                                  'Open', 'Resolved'))
+
+    def test_persisted(self):
+        workflow = Workflow(DiskCache(self.directory))
+        path = workflow.path('MMSANDBOX', 'Bug', 'Open', 'In Review')
+        self.assertEqual(['4', '711', '721'], [x['id'] for x in path])
+
+    def test_reachable(self):
+        self.assertEqual(['In Progress', 'Open', 'Ready for Review',
+                          'Resolved', 'In Review'],
+                         self.workflow.reachable('MMSANDBOX', 'Bug',
+                                                 'In Progress'))
+
+    def test_forget(self):
+        self.workflow.forget('MMSANDBOX', 'Bug', 'In Progress')
+        self.assertEqual(None, self.workflow.path('MMSANDBOX', 'Bug', 'Open',
+                                                  'In Review'))
+
+
+class Named(object):
+
+    def __init__(self, name):
+        self.key = name
+        self.name = name
+
+
+class FakeFields(object):
+
+    def __init__(self, status):
+        self.project = Named('MMSANDBOX')
+        self.issuetype = Named('Bug')
+        self.status = Named(status)
+
+
+class FakeIssue(object):
+
+    def __init__(self, key, status):
+        self.key = key
+        self.fields = FakeFields(status)
+        self.raw = {'key': key, 'fields': {'status': {'name': status}}}
+
+
+class FakeServer(object):
+    '''
+    Runs a Jira workflow for some issues:
+    Open -> In Progress -> Resolved -> Closed (and back again).
+    '''
+
+    WORKFLOW = {
+        'Open': [_transition('4', 'Start Progress', 'In Progress')],
+        'In Progress': [_transition('301', 'Stop Progress', 'Open'),
+                        _transition('5', 'Resolve Issue', 'Resolved')],
+        'Resolved': [_transition('3', 'Reopen Issue', 'Open'),
+                     _transition('701', 'Close Issue', 'Closed')],
+        'Closed': [_transition('3', 'Reopen Issue', 'Open')],
+    }
+
+    def __init__(self, others=None):
+        # issue key -> status; MMSANDBOX-1 is the one being moved:
+        self.statuses = {'MMSANDBOX-1': 'Open'}
+        self.statuses.update(others or {})
+        self.listed = 0
+        self.searches = []
+        self.comments = []
+
+    @property
+    def status(self):
+        return self.statuses['MMSANDBOX-1']
+
+    def issue(self, key, fields=None):
+        return FakeIssue(key, self.statuses[key])
+
+    def search_issues(self, jql, startAt=0, maxResults=50, fields=None,
+                      validate_query=True, json_result=None):
+        self.searches.append(jql)
+        status = jql.split('status = ')[1].strip('"')
+        keys = sorted(x for x, y in self.statuses.items() if y == status)
+        return {'total': len(keys),
+                'issues': [{'key': x} for x in keys[:maxResults]]}
+
+    def transitions(self, issue):
+        self.listed += 1
+        return self.WORKFLOW[self.statuses[getattr(issue, 'key', issue)]]
+
+    def transition_issue(self, issue, transition, fields=None, comment=None):
+        edge = [x for x in self.WORKFLOW[self.statuses[issue.key]]
+                if x['id'] == transition][0]
+        self.statuses[issue.key] = edge['to']['name']
+        self.comments.append(comment)
+
+
+class TestMoveIssue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jira = Jira({'server': 'https://jira.example.com',
+                          'username': 'test.user',
+                          'cache_dir': self.directory})
+        # other issues are in the statuses the one being moved isn't:
+        self.server = FakeServer({'MMSANDBOX-2': 'In Progress',
+                                  'MMSANDBOX-3': 'Resolved'})
+        self.jira._server = self.server
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_explore(self):
+        # the workflow is learned from the other issues before any move:
+        taken = self.jira.move_issue('MMSANDBOX-1', 'Closed',
+                                     comment='done')
+        self.assertEqual(['Start Progress', 'Resolve Issue', 'Close Issue'],
+                         taken)
+        self.assertEqual('Closed', self.server.status)
+        self.assertEqual(3, self.server.listed)
+        self.assertEqual([None, None, 'done'], self.server.comments)
+        self.assertEqual('In Progress', self.server.statuses['MMSANDBOX-2'])
+        self.assertEqual('Resolved', self.server.statuses['MMSANDBOX-3'])
+
+    def test_learned(self):
+        self.jira.move_issue('MMSANDBOX-1', 'Closed')
+        self.server.statuses['MMSANDBOX-1'] = 'Open'
+        listed = self.server.listed
+        taken = self.jira.move_issue('MMSANDBOX-1', 'Closed')
+        self.assertEqual(3, len(taken))
+        self.assertEqual(listed, self.server.listed)
+
+    def test_no_path(self):
+        with self.assertRaises(InvalidJiraStatusException) as raised:
+            self.jira.move_issue('MMSANDBOX-1', 'Gobbledygook')
+        self.assertIn('Valid transitions: Start Progress',
+                      '{0}'.format(raised.exception))
+        # nothing was written:
+        self.assertEqual('Open', self.server.status)
+        self.assertEqual([], self.server.comments)
+
+    def test_no_other_issues(self):
+        self.server = FakeServer()
+        self.jira._server = self.server
+        with self.assertRaises(InvalidJiraStatusException):
+            self.jira.move_issue('MMSANDBOX-1', 'Closed')
+        self.assertEqual('Open', self.server.status)
+        self.assertEqual([], self.server.comments)
+
+    def test_no_explore(self):
+        with self.assertRaises(InvalidJiraStatusException):
+            self.jira.move_issue('MMSANDBOX-1', 'Closed', explore=False)
+        self.assertEqual('Open', self.server.status)
+        self.assertEqual([], self.server.searches)
+
+
+class TestTransitionIssue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.jira = Jira({'server': 'https://jira.example.com',
+                          'username': 'test.user',
+                          'cache_dir': self.directory})
+        self.server = FakeServer()
+        self.jira._server = self.server
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stale_workflow(self):
+        # what was learned about 'Open' is out of date:
+        self.jira.workflow.learn('MMSANDBOX', 'Bug', 'Open', [
+            _transition('2', 'Close Issue', 'Closed')])
+        with self.jira.unit_of_work():
+            self.jira.transition_issue('MMSANDBOX-1',
+                                       status='Start Progress')
+        self.assertEqual('In Progress', self.server.status)
+        self.assertEqual(1, self.server.listed)
+
+    def test_listed_once(self):
+        with self.jira.unit_of_work():
+            with self.assertRaises(InvalidJiraStatusException):
+                self.jira.transition_issue('MMSANDBOX-1',
+                                           status='In Review')
+        self.assertEqual(1, self.server.listed)
+        self.assertEqual('Open', self.server.status)
+
+    def test_cached_miss_listed_once(self):
+        self.jira.workflow.learn('MMSANDBOX', 'Bug', 'Open',
+                                 FakeServer.WORKFLOW['Open'])
+        with self.jira.unit_of_work():
+            self.assertEqual(None, self.jira.find_transition('MMSANDBOX-1',
+                                                             'In Review'))
+            self.assertEqual(None, self.jira.find_transition('MMSANDBOX-1',
+                                                             'In Review'))
+        self.assertEqual(1, self.server.listed)
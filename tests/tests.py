@@ -5,6 +5,7 @@ from configobj import ConfigObj
 import contextlib
 import os
 import re
+import shutil
 from sh import svnadmin
 from sh import svn
 from StringIO import StringIO
@@ -127,12 +128,23 @@ class TestGetTicketFromDir(unittest.TestCase):
         rv = air._parse_ticket(string)
         self.assertEqual('SCSP-10', rv)
 
+    def test__find_tickets(self):
+        log = '''r12 | first.last | created branch for SCSP-10
+   A /branches/Server/SCSP-10_blahblah_SCSP-11
+r13 | first.last | fixed SCSP-12 and SCSP-10
+'''
+        rv = air._find_tickets(log)
+        self.assertEqual(['SCSP-10', 'SCSP-11', 'SCSP-12'], rv)
+
 
 class TestBranchName(unittest.TestCase):
 
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug for/making branch"
@@ -165,6 +177,9 @@ class TestMakeBranch(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug for making branch"
@@ -195,6 +210,9 @@ class TestSvn(unittest.TestCase):
 
     def setUp(self):
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.repo_url, self.repo_file = setup_svn()
@@ -228,6 +246,9 @@ class TestRefresh(unittest.TestCase):
 
     def setUp(self):
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.repo_url, self.repo_file = setup_svn()
@@ -241,7 +262,8 @@ class TestRefresh(unittest.TestCase):
 
         self.summary = "test bug for refresh"
         self.jira = air.Jira(self.config['jira'])
-        self.svn = air.Subversion(self.config['svn'])
+        self.svn = air.Subversion(self.config['svn'],
+                                  cache_config=self.config['jira'])
         self.bug = self.jira.create_issue(self.summary, self.summary)
         self.svn.make_branch(self.bug.key, "test commit message")
 
@@ -265,6 +287,9 @@ class TestCloseBug(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug to close"
@@ -287,6 +312,9 @@ class TestCloseTask(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test issue to close"
@@ -310,6 +338,9 @@ class TestJira(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.bug = None
@@ -342,10 +373,47 @@ class TestJira(unittest.TestCase):
         self.assertRegexpMatches(actual, 'task created: MMSANDBOX-\d*')
 
 
+class TestImportIssues(unittest.TestCase):
+
+    def setUp(self):
+        self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
+        self.config['jira']['password'] = get_jira_pass()
+        self.config['crucible']['password'] = get_jira_pass()
+        self.jira = air.Jira(self.config['jira'])
+        self.keys = []
+
+    def tearDown(self):
+        for key in self.keys:
+            self.jira.delete_issue(key)
+
+    def test_import_issues(self):
+        source = tempfile.NamedTemporaryFile(suffix='.json', delete=False)
+        overwrite(source, '{"summary": "imported bug"}\n'
+                          '{"description": "no summary"}\n'
+                          '{"summary": "imported task", "type": "Task"}\n')
+        sys.argv = ['bogus', 'import_issues', source.name]
+        d = air.Dispatcher(self.config)
+        out = StringIO()
+        d.go(out=out)
+        lines = out.getvalue().strip().split('\n')
+        self.keys = [x for x in lines if re.match('MMSANDBOX-\d*$', x)]
+        self.assertEqual(3, len(lines))
+        self.assertEqual(2, len(self.keys))
+        self.assertEqual('row 2 failed: a summary is required', lines[1])
+        issue = self.jira.get_issue(lines[2])
+        self.assertEqual('Task', issue.fields.issuetype.name)
+
+
 class TestCloseJiraIssue(unittest.TestCase):
 
     def setUp(self):
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug for closing issue"
@@ -363,6 +431,27 @@ class TestCloseJiraIssue(unittest.TestCase):
         expected = 'Resolved'
         self.assertEqual(expected, issue.fields.status.name)
 
+    def test_transition_with_comment(self):
+        """
+        Check that a comment can be added as part of a transition.
+        """
+        issue = self.jira.transition_issue(self.bug, status='Resolve Issue',
+                                           comment='resolving')
+        self.assertEqual('Resolved', issue.fields.status.name)
+        actual = issue.fields.comment.comments[0].body
+        self.assertEqual('resolving', actual)
+
+    def test_move_issue(self):
+        """
+        Check that moving an issue follows the workflow to the status.
+        """
+        self.jira.transition_issue(self.bug, status='Start Progress')
+        taken = self.jira.move_issue(self.bug, 'Resolved')
+        self.assertEqual(['Stop Progress', 'Resolve Issue'], taken)
+        expected = 'Resolved'
+        actual = self.jira.get_issue(self.bug).fields.status.name
+        self.assertEqual(expected, actual)
+
     def test_bad_transition(self):
         """
         Check that trying an invalid status transition throws the right
@@ -372,11 +461,50 @@ class TestCloseJiraIssue(unittest.TestCase):
             self.jira.transition_issue(self.bug, status='Gobbldygook')
 
 
+class TestUnitOfWork(unittest.TestCase):
+
+    def setUp(self):
+        self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
+        self.config['jira']['password'] = get_jira_pass()
+        self.summary = "test bug for unit of work"
+        self.jira = air.Jira(self.config['jira'])
+        self.bug = self.jira.create_issue(self.summary, self.summary)
+
+    def tearDown(self):
+        self.bug.delete()
+
+    def test_shared_issue(self):
+        with self.jira.unit_of_work():
+            first = self.jira.get_issue(self.bug.key)
+            second = self.jira.get_issue(self.bug.key)
+            self.assertIs(first, second)
+        self.assertEqual(1, self.jira.saved_calls['issue'])
+
+    def test_write_invalidates(self):
+        with self.jira.unit_of_work():
+            first = self.jira.get_issue(self.bug.key)
+            self.jira.add_comment(self.bug.key, 'a comment')
+            second = self.jira.get_issue(self.bug.key)
+            self.assertIsNot(first, second)
+
+    def test_prefetch(self):
+        self.jira.prefetch([self.bug.key])
+        self.assertIsNotNone(self.jira.issue_cache.get(self.bug.key))
+        self.assertIsNotNone(self.jira.workflow.transitions(
+            *self.jira._node(self.bug)))
+
+
 class TestListIssues(unittest.TestCase):
 
     def setUp(self):
         # the test config has both a JQL string and a filter name
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug for listing issues"
@@ -400,6 +528,20 @@ class TestListIssues(unittest.TestCase):
         # and it should be the one we just created:
         self.assertEqual(expected, actual)
 
+    def test_stream(self):
+        self.jira.config['list']['jql'] = \
+                'assignee=currentUser() AND issue={0}'.format(self.bug.key)
+        # with a page size of one every page after the first is prefetched:
+        self.jira.config['page_size'] = 1
+        keys = [x.key for x in self.jira.list_issues(stream=True)]
+        self.assertEqual([self.bug.key], keys)
+
+    def test_fields(self):
+        self.jira.config['list']['jql'] = \
+                'assignee=currentUser() AND issue={0}'.format(self.bug.key)
+        issues = self.jira.list_issues(fields=['summary'])
+        self.assertEqual(self.summary, issues[0].summary)
+
     @unittest.skip('I do not know of a way to create a filter \
         programmatically so this test would only work for me')
     def test_filter(self):
@@ -411,6 +553,9 @@ class TestAddComment(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug for start of work"
@@ -441,6 +586,9 @@ class TestConfig(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
 
@@ -456,6 +604,9 @@ class TestFinishWork(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
 
@@ -488,6 +639,9 @@ class TestStartWork(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
         self.summary = "test bug for start of work"
@@ -540,6 +694,9 @@ class TestMain(unittest.TestCase):
     def setUp(self):
         # mock the configuration file:
         self.config = ConfigObj('./tests/config')
+        # keep the on-disk caches apart from the real ones in ~/.air:
+        self.config['jira']['cache_dir'] = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.config['jira']['cache_dir'])
         self.config['jira']['password'] = get_jira_pass()
         self.config['crucible']['password'] = get_jira_pass()
 